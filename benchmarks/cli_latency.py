@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Measures how long the wifi command takes, the way a user runs it.
+
+Every command runs as a fresh ``python -m wifi`` process against stand-in
+iwlist, ifup and ifdown executables in a temporary directory, which is put
+first on the PATH and passed in ``WIFI_IWLIST``, ``WIFI_IFUP`` and
+``WIFI_IFDOWN``.  The stand-ins can be made slow and the scan can be made
+big, and the commands that read the interfaces file run against generated
+files of each of the given sizes.  Besides the latency of each command,
+the report has the time it takes to import wifi.cli and how many external
+commands each wifi command ran.
+
+Run it from the root of the repository::
+
+    $ python benchmarks/cli_latency.py --cells 40 --schemes 10,1000 --repeat 5
+"""
+from __future__ import print_function, division
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from wifi.utils import print_table
+
+
+CELL = """          Cell {number:02d} - Address: 02:00:00:00:{high:02X}:{low:02X}
+                    Channel:{channel}
+                    Frequency:{frequency} GHz (Channel {channel})
+                    Quality={quality}/70  Signal level={signal} dBm
+                    Encryption key:off
+                    ESSID:"net{number}"
+                    Bit Rates:1 Mb/s; 2 Mb/s; 5.5 Mb/s; 11 Mb/s; 6 Mb/s
+                              9 Mb/s; 12 Mb/s; 18 Mb/s
+                    Bit Rates:24 Mb/s; 36 Mb/s; 48 Mb/s; 54 Mb/s
+                    Mode:Master
+                    Extra:tsf=0000000000000000
+                    Extra: Last beacon: 100ms ago
+                    IE: Unknown: 000A
+"""
+
+TOOL = """#!{python}
+import sys
+import time
+
+with open({log!r}, 'a') as f:
+    f.write({name!r} + '\\n')
+time.sleep({delay!r})
+{body}
+"""
+
+BODIES = {
+    'iwlist': "sys.stdout.write(open({output!r}).read())",
+    'ifup': "print('bound to 192.168.1.113 -- renewal in 300 seconds.')",
+    'ifdown': "",
+}
+
+
+def iwlist_output(cells):
+    output = 'wlan0     Scan completed :\n'
+    for number in range(1, cells + 1):
+        channel = number % 11 + 1
+        output += CELL.format(number=number, high=number // 256, low=number % 256, channel=channel,
+                              frequency=(2407 + 5 * channel) / 1000.0, quality=70 - number % 60,
+                              signal=-40 - number % 60)
+    return output
+
+
+def interfaces_file(schemes):
+    return ''.join('\niface wlan0-scheme{0} inet dhcp\n    wireless-essid net{1}\n    wireless-channel auto\n'
+                   .format(i, i + 1) for i in range(schemes))
+
+
+def write_tool(directory, name, delay, log, **params):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(TOOL.format(python=sys.executable, log=log, name=name, delay=delay,
+                            body=BODIES[name].format(**params)))
+    os.chmod(path, 0o755)
+    return path
+
+
+class Bench(object):
+    def __init__(self, directory, cells, scan_delay, ifup_delay, ifdown_delay):
+        self.directory = directory
+        self.log = os.path.join(directory, 'calls.log')
+        output = os.path.join(directory, 'iwlist-output')
+        with open(output, 'w') as f:
+            f.write(iwlist_output(cells))
+
+        bin_dir = os.path.join(directory, 'bin')
+        os.mkdir(bin_dir)
+        self.env = dict(
+            os.environ,
+            PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+            PYTHONPATH=ROOT,
+            WIFI_IWLIST=write_tool(bin_dir, 'iwlist', scan_delay, self.log, output=output),
+            WIFI_IFUP=write_tool(bin_dir, 'ifup', ifup_delay, self.log),
+            WIFI_IFDOWN=write_tool(bin_dir, 'ifdown', ifdown_delay, self.log),
+            # Make sure a running daemon doesn't answer instead.
+            WIFI_SOCKET=os.path.join(directory, 'no-daemon.sock'),
+        )
+
+    def time(self, argv):
+        """
+        Returns the wall time of running `argv` and the number of external
+        commands it ran.
+        """
+        open(self.log, 'w').close()
+        start = time.time()
+        process = subprocess.Popen(argv, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        elapsed = time.time() - start
+        if process.returncode:
+            raise RuntimeError('{0} failed: {1}'.format(' '.join(argv), err.decode('utf-8', 'replace')))
+        with open(self.log) as f:
+            return elapsed, len(f.read().splitlines())
+
+    def wifi(self, *args):
+        return self.time([sys.executable, '-m', 'wifi'] + list(args))
+
+
+def summarize(name, size, results):
+    times = sorted(elapsed for elapsed, calls in results)
+    calls = sum(calls for elapsed, calls in results) / len(results)
+    return [name, size, '{0:.1f}'.format(times[len(times) // 2] * 1000),
+            '{0:.1f}'.format(times[0] * 1000), '{0:.1f}'.format(times[-1] * 1000), '{0:g}'.format(calls)]
+
+
+def run(args):
+    directory = tempfile.mkdtemp()
+    try:
+        bench = Bench(directory, args.cells, args.scan_delay, args.ifup_delay, args.ifdown_delay)
+        rows = [['command', 'schemes', 'median ms', 'min ms', 'max ms', 'subprocesses']]
+
+        baseline = [bench.time([sys.executable, '-c', 'pass']) for i in range(args.repeat)]
+        imports = [bench.time([sys.executable, '-c', 'import wifi.cli']) for i in range(args.repeat)]
+        rows.append(summarize('python startup', '', baseline))
+        rows.append(summarize('import wifi.cli', '', imports))
+
+        for size in args.schemes:
+            interfaces = os.path.join(directory, 'interfaces-{0}'.format(size))
+            with open(interfaces, 'w') as f:
+                f.write(interfaces_file(size))
+
+            def repeat(*command):
+                return [bench.wifi('-f', interfaces, *command) for i in range(args.repeat)]
+
+            rows.append(summarize('scan', size, repeat('scan')))
+            rows.append(summarize('list', size, repeat('list')))
+            rows.append(summarize('add', size, [bench.wifi('-f', interfaces, 'add', 'bench{0}'.format(i), 'net1')
+                                                for i in range(args.repeat)]))
+            if size:
+                rows.append(summarize('connect', size, repeat('connect', 'scheme0')))
+                rows.append(summarize('autoconnect', size, repeat('autoconnect')))
+
+        print_table(rows)
+    finally:
+        shutil.rmtree(directory)
+
+
+def sizes(value):
+    return [int(size) for size in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency of the wifi command.")
+    parser.add_argument('--cells', type=int, default=20,
+                        help="The number of networks the stand-in iwlist reports.")
+    parser.add_argument('--schemes', type=sizes, default=[10, 1000],
+                        help="Comma separated sizes of the generated interfaces files.")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="How many times each command is run.")
+    parser.add_argument('--scan-delay', type=float, default=0,
+                        help="Seconds the stand-in iwlist takes.")
+    parser.add_argument('--ifup-delay', type=float, default=0,
+                        help="Seconds the stand-in ifup takes.")
+    parser.add_argument('--ifdown-delay', type=float, default=0,
+                        help="Seconds the stand-in ifdown takes.")
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -40,7 +40,7 @@ data_files = []
 
 if should_install_cli:
     entry_points['console_scripts'] = [
-        '{command} = wifi.cli:main'.format(command=command_name),
+        '{command} = wifi.__main__:main'.format(command=command_name),
     ]
     # make sure we actually have write access to the target folder and if not don't
     # include it in data_files
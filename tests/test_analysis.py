@@ -0,0 +1,49 @@
+from unittest import TestCase, skipIf
+
+from wifi import Cell
+from wifi import analysis
+
+
+def make_cell(channel, signal):
+    cell = Cell()
+    cell.channel = channel
+    cell.signal = signal
+    return cell
+
+
+CELLS = [make_cell(1, -40), make_cell(6, -60), make_cell(6, -70), make_cell(11, -45),
+         make_cell(36, -60), make_cell(None, -30)]
+
+
+class AnalysisTest(TestCase):
+    def test_overlap(self):
+        self.assertEqual(analysis.overlap(6, 6), 1.0)
+        self.assertEqual(analysis.overlap(6, 8), 0.6)
+        self.assertEqual(analysis.overlap(1, 6), 0.0)
+        self.assertEqual(analysis.overlap(36, 40), 0.0)
+
+    def test_occupancy(self):
+        self.assertEqual(analysis.occupancy(CELLS), {1: 1, 6: 2, 11: 1, 36: 1})
+
+    def test_recommend_channel(self):
+        self.assertEqual(analysis.recommend_channel(CELLS), 6)
+        self.assertEqual(analysis.recommend_channel(CELLS, analysis.CHANNELS_5GHZ), 40)
+        self.assertEqual(analysis.recommend_channel([]), 1)
+
+    def test_interference(self):
+        scores = analysis.interference([make_cell(6, -50)], [4, 6, 11])
+        self.assertAlmostEqual(scores[6], 1e-5)
+        self.assertAlmostEqual(scores[4], 0.6e-5)
+        self.assertEqual(scores[11], 0)
+
+    @skipIf(analysis.numpy is None, "NumPy isn't installed")
+    def test_numpy_matches_pure_python(self):
+        channels = analysis.CHANNELS_24GHZ + analysis.CHANNELS_5GHZ
+        vectorized = analysis.interference(CELLS, channels)
+        numpy, analysis.numpy = analysis.numpy, None
+        try:
+            pure = analysis.interference(CELLS, channels)
+        finally:
+            analysis.numpy = numpy
+        for channel in channels:
+            self.assertAlmostEqual(vectorized[channel], pure[channel])
@@ -0,0 +1,63 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import os
+
+from wifi import Scheme, runner
+from wifi.cli import arg_parser, find_cell
+from wifi.history import History
+
+from tests.test_parsing import IWLIST_SCAN_NO_ENCRYPTION, IWLIST_SCAN_WEP, RunnerTestCase, ScriptedRunner, scan_output
+from tests.test_schemes import SUCCESSFUL_IFUP_OUTPUT
+
+
+class FindCellTest(RunnerTestCase):
+    SCAN = scan_output(IWLIST_SCAN_WEP, IWLIST_SCAN_NO_ENCRYPTION)
+
+    def test_exact_ssid_is_probed_for(self):
+        runner.set_runner(ScriptedRunner({
+            ('wlan0', 'scanning', 'essid', 'WEP Network'): self.SCAN,
+        }))
+        self.assertEqual(find_cell('wlan0', 'WEP Network').ssid, 'WEP Network')
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scanning', 'essid', 'WEP Network')])
+
+    def test_fuzzy_match_scans_once(self):
+        runner.set_runner(ScriptedRunner({
+            ('wlan0', 'scanning', 'essid', 'wireless'): self.SCAN,
+            ('wlan0', 'scan'): self.SCAN,
+        }))
+        self.assertEqual(find_cell('wlan0', 'wireless').ssid, 'My Wireless Network')
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scanning', 'essid', 'wireless'), ('wlan0', 'scan')])
+
+    def test_different_case(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scan'): self.SCAN}))
+        self.assertEqual(find_cell('wlan0', 'wep network', probe=False).ssid, 'WEP Network')
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scan')])
+
+
+class ConnectHistoryTest(RunnerTestCase):
+    def setUp(self):
+        super(ConnectHistoryTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.interfaces = os.path.join(self.directory, 'interfaces')
+        with open(self.interfaces, 'w') as f:
+            f.write('iface wlan0-home inet dhcp\n    wireless-essid WEP Network\n')
+        self.history = os.path.join(self.directory, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ConnectHistoryTest, self).tearDown()
+
+    def test_records_cell(self):
+        scheme = Scheme('wlan0', 'home', {'wireless-essid': 'WEP Network'})
+        runner.set_runner(ScriptedRunner({
+            ('wlan0', 'scanning', 'essid', 'WEP Network'): scan_output(IWLIST_SCAN_WEP),
+            ('wlan0',): b'',
+            tuple(scheme.as_args()): SUCCESSFUL_IFUP_OUTPUT.encode('utf-8'),
+        }))
+        parser, subparsers = arg_parser()
+        args = parser.parse_args(['-f', self.interfaces, '--history', self.history, 'connect', 'home'])
+        args.func(args)
+
+        with History(self.history) as history:
+            self.assertEqual(history.last_good_bssid(scheme), '00:21:27:35:1B:E8')
@@ -0,0 +1,82 @@
+from unittest import TestCase, skipIf
+import subprocess
+import tempfile
+import shutil
+import sys
+import os
+
+from wifi.cli import arg_parser
+from wifi.completion import COMMANDS, complete, read_index
+from wifi.scheme import Scheme
+
+
+INTERFACES = """
+iface wlan0-home inet dhcp
+    wpa-ssid homewifi
+
+iface wlan0-work inet dhcp
+    wpa-ssid workwifi
+"""
+
+
+class CompletionTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.interfaces = os.path.join(self.directory, 'interfaces')
+        with open(self.interfaces, 'w') as f:
+            f.write(INTERFACES)
+        self.Scheme = Scheme.for_file(self.interfaces)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_commands_match_parser(self):
+        parser, subparsers = arg_parser()
+        self.assertEqual(sorted(COMMANDS), sorted(subparsers.choices))
+
+    def test_commands(self):
+        self.assertEqual(complete(1, ['wifi']), COMMANDS)
+        self.assertEqual(complete(3, ['wifi', '-i', 'wlan1']), COMMANDS)
+        self.assertEqual(complete(2, ['wifi', 'scan']), [])
+
+    def test_connect_uses_file_option(self):
+        words = ['wifi', '-f', self.interfaces, 'connect']
+        self.assertEqual(complete(4, words), ['home', 'work'])
+        self.assertEqual(read_index(self.interfaces), [('wlan0', 'home', 1, 50), ('wlan0', 'work', 51, 100)])
+
+    def test_save_and_delete_refresh_index(self):
+        self.Scheme('wlan0', 'cafe').save()
+        self.assertEqual(read_index(self.interfaces)[-1], ('wlan0', 'cafe', 101, 128))
+
+        self.Scheme.find('wlan0', 'home').delete()
+        self.assertEqual(read_index(self.interfaces), [('wlan0', 'work', 2, 51), ('wlan0', 'cafe', 52, 79)])
+
+    def test_index_ranges_match_stanzas(self):
+        self.Scheme('wlan0', 'cafe', {'wireless-essid': 'cafe'}).save()
+        self.Scheme.find('wlan0', 'home').delete()
+
+        with open(self.interfaces, 'rb') as f:
+            content = f.read()
+        stanzas = [content[start:end] for interface, name, start, end in read_index(self.interfaces)]
+        self.assertEqual(stanzas, [b'iface wlan0-work inet dhcp\n    wpa-ssid workwifi\n',
+                                   b'iface wlan0-cafe inet dhcp\n    wireless-essid cafe\n'])
+
+    def test_stale_index_is_ignored(self):
+        self.Scheme.refresh_index()
+        with open(self.interfaces, 'a') as f:
+            f.write('\niface wlan0-cafe inet dhcp\n')
+        self.assertIsNone(read_index(self.interfaces))
+        self.assertEqual(complete(3, ['wifi', '--file=' + self.interfaces, 'connect']),
+                         ['home', 'work', 'cafe'])
+
+    @skipIf(sys.version_info < (3, 7), "wifi imports Cell and Scheme right away before Python 3.7")
+    def test_entry_point_only_imports_completion(self):
+        self.Scheme.refresh_index()
+        code = ("import sys\n"
+                "from wifi.__main__ import main\n"
+                "main()\n"
+                "print(' '.join(sorted(name for name in sys.modules if name.startswith('wifi'))))\n")
+        env = dict(os.environ, WIFI_AUTOCOMPLETE='1', COMP_CWORD='4',
+                   COMP_WORDS='wifi -f {0} connect'.format(self.interfaces))
+        output = subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf-8')
+        self.assertEqual(output.splitlines(), ['home work', 'wifi wifi.__main__ wifi.completion'])
@@ -0,0 +1,117 @@
+from unittest import TestCase
+import tempfile
+import threading
+import shutil
+import time
+import os
+
+from wifi.coordinator import Coordinator
+from wifi.locking import FileLock
+from wifi.scheme import Connection, Scheme
+from wifi.exceptions import ConnectionError, InterfaceBusyError
+
+
+class SlowScheme(Scheme):
+    """
+    Records which interfaces are being activated whenever one starts.  With
+    the ``wait_for`` option, it stays active until that interface is too,
+    or for a second at most.  The ``started`` event is set once it is
+    active, and with ``release`` it stays active until that event is set.
+    """
+    active = {}
+    overlaps = []
+    condition = threading.Condition()
+
+    def activate(self, timeout=None):
+        with self.condition:
+            self.active[self.interface] = self.active.get(self.interface, 0) + 1
+            self.overlaps.append(sorted(i for i, n in self.active.items() if n))
+            self.condition.notify_all()
+
+            deadline = time.time() + 1
+            while self.options.get('wait_for') and not self.active.get(self.options['wait_for']):
+                if time.time() >= deadline:
+                    break
+                self.condition.wait(deadline - time.time())
+        if self.options.get('started'):
+            self.options['started'].set()
+        if self.options.get('release'):
+            self.options['release'].wait(5)
+        else:
+            time.sleep(0.1)
+        with self.condition:
+            self.active[self.interface] -= 1
+        if self.options.get('fail'):
+            raise ConnectionError("Failed to connect to %r" % self)
+        if self.options.get('error'):
+            raise self.options['error']
+        return Connection(scheme=self, ip_address='192.168.1.113')
+
+
+class CoordinatorTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        SlowScheme.active = {}
+        SlowScheme.overlaps = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_different_interfaces_in_parallel(self):
+        schemes = [SlowScheme('wlan0', 'home', {'wait_for': 'wlan1'}),
+                   SlowScheme('wlan1', 'work', {'wait_for': 'wlan0'})]
+
+        connections, attempts = Coordinator(self.directory).activate_all(schemes)
+
+        self.assertIn(['wlan0', 'wlan1'], SlowScheme.overlaps)
+        self.assertEqual([c.scheme for c in connections], schemes)
+        self.assertTrue(all(attempt.succeeded for attempt in attempts))
+
+    def test_same_interface_in_turn(self):
+        schemes = [SlowScheme('wlan0', 'home'), SlowScheme('wlan0', 'work', {'fail': True})]
+
+        connections, attempts = Coordinator(self.directory).activate_all(schemes)
+
+        self.assertEqual(SlowScheme.overlaps, [['wlan0'], ['wlan0']])
+        self.assertEqual(connections[1], None)
+        self.assertIsInstance(attempts[1].error, ConnectionError)
+
+    def test_unexpected_error_is_recorded(self):
+        schemes = [SlowScheme('wlan0', 'home', {'error': OSError("Permission denied")}),
+                   SlowScheme('wlan0', 'work')]
+
+        connections, attempts = Coordinator(self.directory).activate_all(schemes)
+
+        self.assertIsInstance(attempts[0].error, OSError)
+        self.assertEqual(connections[1].scheme, schemes[1])
+        self.assertTrue(attempts[1].succeeded)
+
+    def test_threads_queue(self):
+        coordinator = Coordinator(self.directory)
+        threads = [threading.Thread(target=coordinator.activate, args=(SlowScheme('wlan0', str(i)),))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(SlowScheme.overlaps), ['wlan0'])
+        self.assertEqual(len(SlowScheme.overlaps), 3)
+
+    def test_reject_when_busy(self):
+        coordinator = Coordinator(self.directory, wait=False)
+        started, release = threading.Event(), threading.Event()
+        home = SlowScheme('wlan0', 'home', {'started': started, 'release': release})
+        thread = threading.Thread(target=coordinator.activate, args=(home,))
+        thread.start()
+        started.wait(5)
+        try:
+            self.assertRaises(InterfaceBusyError, coordinator.activate, SlowScheme('wlan0', 'work'))
+        finally:
+            release.set()
+            thread.join()
+
+    def test_lock_file_held_by_another_process(self):
+        with FileLock(os.path.join(self.directory, 'wlan0.lock')):
+            self.assertRaises(InterfaceBusyError, Coordinator(self.directory).activate,
+                              SlowScheme('wlan0', 'home'), 0.1)
+        self.assertEqual(SlowScheme.overlaps, [])
@@ -0,0 +1,108 @@
+from unittest import TestCase
+import tempfile
+import threading
+import shutil
+import os
+
+from wifi import Cell
+from wifi.daemon import Client, Daemon, Server
+from wifi.exceptions import DaemonError
+from wifi.utils import monotonic
+
+from tests.test_wpa_supplicant import FakeSupplicant
+
+
+INTERFACES = """
+iface wlan0-home inet dhcp
+    wpa-ssid homewifi
+
+iface wlan0-coffee inet dhcp
+    wireless-essid Coffee WiFi
+"""
+
+
+class DaemonTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.interfaces = os.path.join(self.directory, 'interfaces')
+        with open(self.interfaces, 'w') as f:
+            f.write(INTERFACES)
+
+        cell = Cell()
+        cell.ssid = 'homewifi'
+        cell.signal = -50
+        self.daemon = Daemon()
+        self.daemon.scans[('wlan0', None)] = (monotonic(), [cell])
+
+        self.path = os.path.join(self.directory, 'wifi.sock')
+        self.server = Server(self.path, self.daemon)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = Client(self.path, 'wlan0', self.interfaces)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_scan_is_cached(self):
+        cells = self.client.scan()
+        self.assertEqual([cell.ssid for cell in cells], ['homewifi'])
+        self.assertEqual(cells[0].signal, -50)
+
+    def test_list(self):
+        self.assertEqual([scheme.name for scheme in self.client.all()], ['home', 'coffee'])
+        self.assertEqual(self.client.all()[0].ssid, 'homewifi')
+
+    def test_list_reloads_changed_file(self):
+        self.client.all()
+        with open(self.interfaces, 'a') as f:
+            f.write('\niface wlan0-work inet dhcp\n    wpa-ssid workwifi\n')
+        self.assertEqual([scheme.name for scheme in self.client.all()], ['home', 'coffee', 'work'])
+
+    def test_unknown_scheme(self):
+        self.assertRaises(DaemonError, self.client.connect, 'nope')
+
+    def test_unknown_command(self):
+        self.assertRaises(DaemonError, self.client.request, 'nope')
+
+    def test_scan_with_wpa_supplicant(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            cells = self.client.scan(ctrl_dir=self.directory)
+        finally:
+            supplicant.close()
+        self.assertEqual([cell.ssid for cell in cells], ['homewifi', 'Coffee WiFi', ''])
+        self.assertIn('SCAN', supplicant.commands)
+
+    def test_last_results_are_not_cached(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            self.client.scan(ctrl_dir=self.directory, last=True)
+            self.assertNotIn('SCAN', supplicant.commands)
+            self.client.scan(ctrl_dir=self.directory)
+        finally:
+            supplicant.close()
+        self.assertIn('SCAN', supplicant.commands)
+
+
+class ServerTest(TestCase):
+    def test_socket_is_private_when_bound(self):
+        directory = tempfile.mkdtemp()
+        modes = []
+
+        class RecordingServer(Server):
+            def server_activate(self):
+                modes.append(os.stat(self.server_address).st_mode)
+                Server.server_activate(self)
+
+        umask = os.umask(0o022)
+        try:
+            server = RecordingServer(os.path.join(directory, 'wifi.sock'), Daemon())
+            server.server_close()
+        finally:
+            os.umask(umask)
+            shutil.rmtree(directory)
+        self.assertEqual(modes[0] & 0o077, 0)
@@ -0,0 +1,67 @@
+from unittest import TestCase
+import tempfile
+import os
+
+from wifi import Cell
+from wifi.history import History
+from wifi.scheme import Attempt, Scheme
+from wifi.exceptions import ConnectionError
+
+
+def make_cell(address, signal):
+    cell = Cell()
+    cell.address = address
+    cell.signal = signal
+    return cell
+
+
+class HistoryTest(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.history = History(self.path)
+        self.home = Scheme('wlan0', 'home', {'wpa-ssid': 'homewifi'})
+        self.work = Scheme('wlan0', 'work', {'wpa-ssid': 'workwifi'})
+
+    def tearDown(self):
+        self.history.close()
+        os.remove(self.path)
+
+    def test_empty(self):
+        self.assertIsNone(self.history.success_rate(self.home))
+        self.assertIsNone(self.history.median_time_to_ip(self.home))
+        self.assertIsNone(self.history.last_good_bssid(self.home))
+
+    def test_success_rate(self):
+        self.history.record(Attempt(self.home, 1.0))
+        self.history.record(Attempt(self.home, 3.0, ConnectionError()))
+        self.history.record(Attempt(self.work, 3.0, ConnectionError()))
+        self.assertEqual(self.history.success_rate(self.home), 0.5)
+        self.assertEqual(self.history.success_rate(self.work), 0)
+
+    def test_median_time_to_ip(self):
+        for duration in (4.0, 1.0, 3.0):
+            self.history.record(Attempt(self.home, duration))
+        self.history.record(Attempt(self.home, 100.0, ConnectionError()))
+        self.assertEqual(self.history.median_time_to_ip(self.home), 3.0)
+
+        self.history.record(Attempt(self.home, 2.0))
+        self.assertEqual(self.history.median_time_to_ip(self.home), 2.5)
+
+    def test_last_good_bssid(self):
+        self.history.record(Attempt(self.home, 1.0), make_cell('00:00:00:00:00:01', -60))
+        self.history.record(Attempt(self.home, 1.0, ConnectionError()), make_cell('00:00:00:00:00:02', -70))
+        self.assertEqual(self.history.last_good_bssid(self.home), '00:00:00:00:00:01')
+
+    def test_rank(self):
+        cafe = Scheme('wlan0', 'cafe', {'wpa-ssid': 'cafe'})
+        self.history.record(Attempt(self.home, 5.0))
+        self.history.record(Attempt(self.work, 1.0))
+        self.assertEqual(self.history.rank([cafe, self.home, self.work]),
+                         [self.work, self.home, cafe])
+
+    def test_persistent(self):
+        self.history.record(Attempt(self.home, 1.0))
+        self.history.close()
+        self.history = History(self.path)
+        self.assertEqual(self.history.success_rate(self.home), 1)
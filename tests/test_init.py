@@ -4,7 +4,8 @@ from wifi.scan import Cell
 
 class CorrectInitTest(TestCase):
     fields = {"ssid": None,
-              "bitrates": [],
+              "ssid_bytes": None,
+              "bitrates": (),
               "address": None,
               "channel": None,
               "encrypted": False,
@@ -12,7 +13,10 @@ class CorrectInitTest(TestCase):
               "frequency": None,
               "mode": None,
               "quality": None,
-              "signal": None}
+              "signal": None,
+              "frequency_mhz": None,
+              "quality_ratio": None,
+              "bitrates_mbps": ()}
 
 
     def test_empty_init(self):
@@ -0,0 +1,91 @@
+from unittest import TestCase
+import tempfile
+import threading
+import shutil
+import os
+
+from wifi.locking import FileLock, locked_file
+from wifi.scheme import Scheme
+
+
+class FileLockTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'interfaces')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_locks_coexist(self):
+        with FileLock(self.path, exclusive=False):
+            other = FileLock(self.path, exclusive=False)
+            self.assertTrue(other.acquire(blocking=False))
+            other.release()
+
+    def test_exclusive_lock_excludes_readers(self):
+        with FileLock(self.path):
+            reader = FileLock(self.path, exclusive=False)
+            self.assertFalse(reader.acquire(blocking=False))
+            self.assertFalse(reader.acquire(timeout=0.1))
+        self.assertTrue(reader.acquire(blocking=False))
+        reader.release()
+
+    def test_locked_file_waits_for_writer(self):
+        with open(self.path, 'w') as f:
+            f.write('old')
+        writer = FileLock(self.path)
+        writer.acquire()
+        contents = []
+
+        def read():
+            with locked_file(self.path) as f:
+                contents.append(f.read())
+        thread = threading.Thread(target=read)
+        thread.start()
+
+        with open(self.path, 'w') as f:
+            f.write('new')
+        writer.release()
+        thread.join()
+        self.assertEqual(contents, ['new'])
+
+
+class ConcurrentSchemeTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.Scheme = Scheme.for_file(os.path.join(self.directory, 'interfaces'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_threads(self, target, count):
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_no_lost_saves(self):
+        self.run_threads(lambda i: self.Scheme('wlan0', str(i), {'wpa-ssid': str(i)}).save(), 20)
+        self.assertEqual(sorted(int(s.name) for s in self.Scheme.all()), list(range(20)))
+
+    def test_save_is_atomic(self):
+        saved = []
+
+        def save(i):
+            try:
+                self.Scheme('wlan0', 'home', {'wpa-ssid': str(i)}).save()
+            except AssertionError:
+                pass
+            else:
+                saved.append(i)
+        self.run_threads(save, 10)
+
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(len(list(self.Scheme.all())), 1)
+
+    def test_concurrent_deletes(self):
+        for i in range(10):
+            self.Scheme('wlan0', str(i), {'wpa-ssid': str(i)}).save()
+        self.run_threads(lambda i: self.Scheme.find('wlan0', str(i)).delete(), 10)
+        self.assertEqual(list(self.Scheme.all()), [])
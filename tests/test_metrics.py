@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from wifi import Cell, metrics, runner
+from wifi.exceptions import InterfaceError
+from wifi.metrics import Registry
+
+from tests.test_parsing import IWLIST_SCAN_WEP, RunnerTestCase, ScriptedRunner, scan_output
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('errors_total', 'Errors.')
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(self.registry.render(),
+                         '# HELP errors_total Errors.\n'
+                         '# TYPE errors_total counter\n'
+                         'errors_total 3\n')
+
+    def test_labels_share_header(self):
+        self.registry.counter('activations_total', 'Activations.', {'outcome': 'success'}).inc()
+        self.registry.counter('activations_total', 'Activations.', {'outcome': 'failure'})
+        self.assertEqual(self.registry.render(),
+                         '# HELP activations_total Activations.\n'
+                         '# TYPE activations_total counter\n'
+                         'activations_total{outcome="success"} 1\n'
+                         'activations_total{outcome="failure"} 0\n')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('scan_seconds', 'Scans.', (1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(self.registry.render(),
+                         '# HELP scan_seconds Scans.\n'
+                         '# TYPE scan_seconds histogram\n'
+                         'scan_seconds_bucket{le="1"} 2\n'
+                         'scan_seconds_bucket{le="5"} 3\n'
+                         'scan_seconds_bucket{le="+Inf"} 4\n'
+                         'scan_seconds_sum 14.5\n'
+                         'scan_seconds_count 4\n')
+
+
+class ScanMetricsTest(RunnerTestCase):
+    def test_failed_probe_isnt_an_error(self):
+        runner.set_runner(ScriptedRunner({}))
+        errors = metrics.interface_errors.value
+        self.assertEqual(Cell.probe('wlan0', 'WEP Network'), [])
+        self.assertEqual(metrics.interface_errors.value, errors)
+
+        self.assertRaises(InterfaceError, Cell.all, 'wlan0')
+        self.assertEqual(metrics.interface_errors.value, errors + 1)
+
+    def test_last_results_are_timed_apart(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scanning', 'last'): scan_output(IWLIST_SCAN_WEP)}))
+        scans = metrics.scan_seconds.count
+        last_scans = metrics.last_scan_seconds.count
+        Cell.all('wlan0', fresh=False)
+        self.assertEqual(metrics.scan_seconds.count, scans)
+        self.assertEqual(metrics.last_scan_seconds.count, last_scans + 1)
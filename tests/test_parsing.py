@@ -1,6 +1,10 @@
-from unittest import TestCase
+# -*- coding: utf-8 -*-
+from unittest import TestCase, skipIf
+import subprocess
+import sys
 
-from wifi.scan import Cell
+from wifi import runner
+from wifi.scan import Cell, block_filter, cells_re, channel_to_mhz, escape_ssid, mhz_to_channel, split_cells
 from wifi.exceptions import InterfaceError
 
 
@@ -77,11 +81,262 @@ class IWListParserTest(TestCase):
         cell = Cell.from_string(LIST_INDEX_ERROR)
         self.assertEqual(cell.noise, -92)
 
+    def test_numeric_fields(self):
+        cell = Cell.from_string(IWLIST_SCAN_NO_ENCRYPTION)
+        self.assertEqual(cell.frequency_mhz, 2437)
+        self.assertEqual(cell.quality_ratio, 59 / 70.)
+        self.assertEqual(cell.bitrates_mbps[:4], (1, 2, 5.5, 11))
+        self.assertEqual(len(cell.bitrates_mbps), len(cell.bitrates))
+        self.assertEqual(cell.frequency, '2.437 GHz')
+        self.assertEqual(cell.quality, '59/70')
+
+        cell = Cell.from_string(ABSOLUTE_QUALITY)
+        self.assertEqual(cell.quality_ratio, 0.38)
+
+    def test_values_are_shared(self):
+        first = Cell.from_string(IWLIST_SCAN_NO_ENCRYPTION.encode('ascii'))
+        second = Cell.from_string(IWLIST_SCAN_NO_ENCRYPTION.encode('ascii'))
+        for name in ('ssid', 'ssid_bytes', 'address', 'mode', 'frequency', 'bitrates', 'bitrates_mbps'):
+            self.assertIs(getattr(first, name), getattr(second, name), name)
+        self.assertIsInstance(first.bitrates, tuple)
+
+    def test_channel_from_frequency(self):
+        cell = Cell.from_string(IWLIST_SCAN_NO_ENCRYPTION
+                                .replace('Channel:6\n', '')
+                                .replace(' (Channel 6)', ''))
+        self.assertEqual(cell.channel, 6)
+
+        cell = Cell.from_string(FREQUENCY_NO_CHANNEL_OUTPUT.replace('Channel:149\n', ''))
+        self.assertEqual(cell.frequency_mhz, 5745)
+        self.assertEqual(cell.channel, 149)
+
+
+class BlockFilterTest(TestCase):
+    def assertAgreesWithParser(self, **conditions):
+        keep = block_filter(**conditions)
+        blocks = [IWLIST_SCAN_NO_ENCRYPTION, IWLIST_SCAN_WEP, IWLIST_SCAN_WPA2, IWLIST_SCAN_WPA1,
+                  ALTERNATIVE_OUTPUT, ALTERNATIVE_OUTPUT2, NONAME_WIRELESS_NETWORK, NO_CHANNEL_OUTPUT,
+                  LIST_INDEX_ERROR, FREQUENCY_NO_CHANNEL_OUTPUT, ABSOLUTE_QUALITY, NO_SSID_AT_ALL]
+        for block in blocks:
+            string = block.split(' - ', 1)[1]
+            cell = Cell.from_string(string)
+            expected = all([
+                conditions.get('ssid', cell.ssid) == cell.ssid,
+                conditions.get('bssid', cell.address) == cell.address,
+                conditions.get('encrypted', cell.encrypted) == cell.encrypted,
+                cell.signal is not None and cell.signal >= conditions.get('min_signal', cell.signal),
+                cell.channel in conditions.get('channels', [cell.channel]),
+                'band' not in conditions or cell.frequency_mhz in BAND_RANGES[conditions['band']],
+            ])
+            self.assertEqual(keep(string), expected, (conditions, block))
+
+    def test_no_conditions(self):
+        self.assertIsNone(block_filter())
+
+    def test_ssid(self):
+        self.assertAgreesWithParser(ssid='My Wireless Network')
+        self.assertAgreesWithParser(ssid='')
+
+    def test_bssid(self):
+        self.assertAgreesWithParser(bssid='00:21:27:35:1B:E8')
+
+    def test_encrypted(self):
+        self.assertAgreesWithParser(encrypted=True)
+        self.assertAgreesWithParser(encrypted=False)
+
+    def test_min_signal(self):
+        self.assertAgreesWithParser(min_signal=-70)
+        self.assertAgreesWithParser(min_signal=-90, encrypted=True)
+
+    def test_channels(self):
+        self.assertAgreesWithParser(channels=[1, 6, 11])
+        self.assertAgreesWithParser(channels=[36, 40])
+
+    def test_band(self):
+        self.assertAgreesWithParser(band='2.4')
+        self.assertAgreesWithParser(band='5')
+        self.assertAgreesWithParser(band='5', channels=[1, 6, 11])
+
+    def test_unknown_band(self):
+        self.assertRaises(ValueError, block_filter, band='60')
+
+
+BAND_RANGES = {'2.4': range(2400, 2501), '5': range(5000, 5901)}
+
+
+class OutputRunner(runner.Runner):
+    def __init__(self, output):
+        super(OutputRunner, self).__init__()
+        self.output = output
+
+    def run(self, tool, args, timeout=None):
+        return self.output
+
+
+class RunnerTestCase(TestCase):
+    """
+    Puts back the default runner after each test.
+    """
+
+    def setUp(self):
+        self.default = runner.get_runner()
+
+    def tearDown(self):
+        runner.set_runner(self.default)
+
+
+class ScriptedRunner(runner.Runner):
+    """
+    Answers each iwlist command from `outputs`, keyed by its arguments, and
+    fails the ones that aren't there.
+    """
+
+    def __init__(self, outputs):
+        super(ScriptedRunner, self).__init__()
+        self.outputs = outputs
+        self.calls = []
+
+    def run(self, tool, args, timeout=None):
+        self.calls.append(tuple(args))
+        try:
+            return self.outputs[tuple(args)]
+        except KeyError:
+            raise subprocess.CalledProcessError(255, [tool] + list(args), b'Interface doesn\'t support scanning.')
+
+
+def scan_output(*blocks):
+    return b'wlan0     Scan completed :\n' + b''.join(
+        block.replace('Cell 02', 'Cell %02d' % i).encode('ascii') for i, block in enumerate(blocks))
+
+
+class LastScanTest(RunnerTestCase):
+    def test_fresh_by_default(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP)}))
+        cell, = Cell.all('wlan0')
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scan')])
+
+    def test_last_results(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scanning', 'last'): scan_output(IWLIST_SCAN_NO_ENCRYPTION)}))
+        cell, = Cell.all('wlan0', fresh=False)
+        self.assertEqual(cell.ssid, 'My Wireless Network')
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scanning', 'last')])
+
+    def test_no_last_results(self):
+        runner.set_runner(ScriptedRunner({
+            ('wlan0', 'scanning', 'last'): b'wlan0     No scan results\n',
+            ('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP),
+        }))
+        cell, = Cell.all('wlan0', fresh=False)
+        self.assertEqual(cell.encryption_type, 'wep')
+
+    def test_stale_results(self):
+        runner.set_runner(ScriptedRunner({
+            ('wlan0', 'scanning', 'last'): scan_output(
+                IWLIST_SCAN_NO_ENCRYPTION.replace('60ms ago', '95000ms ago')),
+            ('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP),
+        }))
+        self.assertEqual([cell.encryption_type for cell in Cell.all('wlan0', fresh=False)], ['wep'])
+        self.assertEqual(len(Cell.all('wlan0', fresh=False, max_age=120)), 1)
+
+    def test_last_not_supported(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP)}))
+        self.assertEqual(len(Cell.all('wlan0', fresh=False)), 1)
+        self.assertEqual(runner.get_runner().calls, [('wlan0', 'scanning', 'last'), ('wlan0', 'scan')])
+
+
+class FindTest(RunnerTestCase):
+    DIRECTED = ('wlan0', 'scanning', 'essid', 'My Wireless Network')
+
+    def test_directed_scan(self):
+        runner.set_runner(ScriptedRunner({self.DIRECTED: scan_output(IWLIST_SCAN_WEP, IWLIST_SCAN_NO_ENCRYPTION)}))
+        cell = Cell.find('wlan0', 'My Wireless Network')
+        self.assertEqual(cell.address, '38:83:45:CC:58:74')
+        self.assertEqual(runner.get_runner().calls, [self.DIRECTED])
+
+    def test_strongest_cell(self):
+        runner.set_runner(ScriptedRunner({self.DIRECTED: scan_output(
+            IWLIST_SCAN_NO_ENCRYPTION.replace('-51 dBm', '-80 dBm'),
+            IWLIST_SCAN_NO_ENCRYPTION.replace('38:83:45:CC:58:74', '38:83:45:CC:58:75'),
+        )}))
+        self.assertEqual(Cell.find('wlan0', 'My Wireless Network').address, '38:83:45:CC:58:75')
+
+    def test_directed_scan_not_supported(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scan'): scan_output(IWLIST_SCAN_NO_ENCRYPTION)}))
+        self.assertEqual(Cell.find('wlan0', 'My Wireless Network').signal, -51)
+        self.assertEqual(runner.get_runner().calls, [self.DIRECTED, ('wlan0', 'scan')])
+
+    def test_directed_scan_misses(self):
+        runner.set_runner(ScriptedRunner({
+            self.DIRECTED: scan_output(IWLIST_SCAN_WEP),
+            ('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP, IWLIST_SCAN_NO_ENCRYPTION),
+        }))
+        self.assertEqual(Cell.find('wlan0', 'My Wireless Network').ssid, 'My Wireless Network')
+
+    def test_not_in_range(self):
+        runner.set_runner(ScriptedRunner({
+            self.DIRECTED: scan_output(IWLIST_SCAN_WEP),
+            ('wlan0', 'scan'): scan_output(IWLIST_SCAN_WEP),
+        }))
+        self.assertIsNone(Cell.find('wlan0', 'My Wireless Network'))
+
+
+class SpectrumTest(RunnerTestCase):
+    def test_all_on_channels(self):
+        runner.set_runner(ScriptedRunner({('wlan0', 'scan'): scan_output(
+            IWLIST_SCAN_NO_ENCRYPTION, IWLIST_SCAN_NO_ENCRYPTION.replace('Channel:6', 'Channel:36').replace(
+                '2.437 GHz (Channel 6)', '5.18 GHz (Channel 36)'))}))
+        self.assertEqual([cell.channel for cell in Cell.all('wlan0', channels=[36])], [36])
+        self.assertEqual([cell.channel for cell in Cell.all('wlan0', band=2.4)], [6])
+
+    def test_channel_to_mhz(self):
+        for channel in [1, 6, 13, 14, 36, 165]:
+            self.assertEqual(mhz_to_channel(channel_to_mhz(channel)), channel)
+        self.assertIsNone(channel_to_mhz(0))
+
+
+class SSIDBytesTest(RunnerTestCase):
+    def scan(self, *ssids):
+        output = b'wlan0     Scan completed :\n'
+        for i, ssid in enumerate(ssids):
+            output += IWLIST_SCAN_NO_ENCRYPTION.replace('Cell 02', 'Cell %02d' % i).encode('ascii').replace(
+                b'"My Wireless Network"', b'"' + ssid + b'"')
+        runner.set_runner(OutputRunner(output))
+        return Cell.all('wlan0')
+
+    def test_escapes_are_decoded(self):
+        cell, = self.scan(b'Caf\\xC3\\xA9')
+        self.assertEqual(cell.ssid_bytes, u'Caf\xe9'.encode('utf-8'))
+        self.assertEqual(cell.ssid, u'Caf\xe9')
+
+    def test_raw_bytes(self):
+        cell, = self.scan(u'Caf\xe9'.encode('utf-8'))
+        self.assertEqual(cell.ssid, u'Caf\xe9')
+
+    @skipIf(sys.version_info[0] < 3, "SSIDs that aren't UTF-8 are decoded with replacement characters")
+    def test_invalid_utf8_does_not_break_the_scan(self):
+        hostile, normal = self.scan(b'\xff\xfe\\x80', b'homewifi')
+        self.assertEqual(hostile.ssid_bytes, b'\xff\xfe\x80')
+        self.assertEqual(hostile.ssid.encode('utf-8', 'surrogateescape'), hostile.ssid_bytes)
+        self.assertEqual(escape_ssid(hostile.ssid), '\\xff\\xfe\\x80')
+        self.assertEqual(normal.ssid, 'homewifi')
+        self.assertEqual(normal.ssid_bytes, b'homewifi')
+
+    def test_where_ssid(self):
+        self.scan(b'Caf\\xC3\\xA9', b'homewifi')
+        self.assertEqual([cell.ssid_bytes for cell in Cell.where('wlan0', ssid=u'Caf\xe9')],
+                         [u'Caf\xe9'.encode('utf-8')])
+
 
 class ScanningTest(TestCase):
     def test_scanning(self):
         self.assertRaises(InterfaceError, Cell.all, 'fake-interface')
 
+    def test_split_cells(self):
+        output = 'wlan0     Scan completed :\n          ' + '          '.join([
+            IWLIST_SCAN_NO_ENCRYPTION, IWLIST_SCAN_WEP, LIST_INDEX_ERROR])
+        self.assertEqual(list(split_cells(output)), cells_re.split(output)[1:])
+        self.assertEqual(list(split_cells('wlan0     No scan results\n')), [])
+
 
 IWLIST_SCAN_NO_ENCRYPTION = """Cell 02 - Address: 38:83:45:CC:58:74
                     Channel:6
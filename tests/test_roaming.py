@@ -0,0 +1,141 @@
+from unittest import TestCase
+import tempfile
+import shutil
+
+from wifi import Cell
+from wifi.roaming import RoamingMonitor, reassociate
+from wifi.scheme import Scheme
+from wifi.tracking import CellTracker
+from wifi.wpa_supplicant import NetworkScheme
+from wifi.exceptions import ConnectionError
+from tests.test_wpa_supplicant import FakeSupplicant, LIST_NETWORKS
+
+
+def make_cell(address, signal, ssid='homewifi'):
+    cell = Cell()
+    cell.ssid = ssid
+    cell.address = address
+    cell.signal = signal
+    return cell
+
+
+class RoamingMonitorTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.roams = []
+        self.monitor = RoamingMonitor(
+            Scheme('wlan0', 'home', {'wpa-ssid': 'homewifi'}), 'AA',
+            threshold=-70, margin=8, samples=3, min_interval=60,
+            reassociate=lambda scheme, cell: self.roams.append(cell.address),
+            clock=lambda: self.now,
+        )
+
+    def weak_link(self):
+        return [make_cell('AA', -80), make_cell('BB', -60), make_cell('CC', -50, 'other')]
+
+    def test_needs_consecutive_samples(self):
+        self.assertIsNone(self.monitor.update(self.weak_link()))
+        self.assertIsNone(self.monitor.update(self.weak_link()))
+        self.assertEqual(self.monitor.update(self.weak_link()).address, 'BB')
+
+    def test_streak_resets(self):
+        self.monitor.update(self.weak_link())
+        self.monitor.update(self.weak_link())
+        self.monitor.update([make_cell('AA', -65), make_cell('BB', -50)])
+        self.assertIsNone(self.monitor.update(self.weak_link()))
+
+    def test_margin(self):
+        for i in range(5):
+            self.assertIsNone(self.monitor.update([make_cell('AA', -80), make_cell('BB', -75)]))
+
+    def test_lost_access_point(self):
+        for i in range(3):
+            cell = self.monitor.update([make_cell('BB', -85)])
+        self.assertEqual(cell.address, 'BB')
+
+    def test_rate_limited(self):
+        for i in range(3):
+            cell = self.monitor.update(self.weak_link())
+        self.monitor.roam(cell)
+        self.assertEqual(self.roams, ['BB'])
+        self.assertEqual(self.monitor.bssid, 'BB')
+
+        back = [make_cell('AA', -60), make_cell('BB', -80)]
+        for i in range(3):
+            self.assertIsNone(self.monitor.update(back))
+        self.now = 61
+        self.assertEqual(self.monitor.update(back).address, 'AA')
+
+    def test_smoothed_by_tracker(self):
+        self.monitor.tracker = CellTracker(alpha=0.5)
+        self.monitor.update([make_cell('AA', -60), make_cell('BB', -60)])
+        # A single weak reading isn't enough to fall below the threshold.
+        for i in range(3):
+            self.assertIsNone(self.monitor.update([make_cell('AA', -78), make_cell('BB', -60)]))
+            self.monitor.update([make_cell('AA', -60), make_cell('BB', -60)])
+
+
+class ReassociateTest(TestCase):
+    def test_keeps_scheme_class(self):
+        activated = []
+
+        class LiveScheme(Scheme):
+            def activate(self, timeout=None):
+                activated.append(self)
+
+        reassociate(LiveScheme('wlan0', 'home', {'wpa-ssid': 'homewifi'}), make_cell('BB', -60))
+        scheme, = activated
+        self.assertIsInstance(scheme, LiveScheme)
+        self.assertEqual(scheme.options['wpa-bssid'], 'BB')
+
+
+class RoamNetworkSchemeTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        scheme = NetworkScheme('wlan0', 'home', {'ssid': '"homewifi"', 'key_mgmt': 'NONE'})
+        scheme.ctrl_dir = self.directory
+        self.monitor = RoamingMonitor(scheme, 'AA:AA:AA:AA:AA:AA')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def roam(self, replies, events):
+        supplicant = FakeSupplicant(self.directory, replies=dict({
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK 0 id_str': '"wlan0-home"',
+            'GET_NETWORK 1 id_str': 'FAIL',
+            'BSSID 0 bb:bb:bb:bb:bb:bb': 'OK',
+        }, **replies), events=events)
+        try:
+            self.monitor.roam(make_cell('BB:BB:BB:BB:BB:BB', -60))
+        finally:
+            supplicant.close()
+        return supplicant.commands
+
+    def test_roam(self):
+        commands = self.roam({
+            'ROAM bb:bb:bb:bb:bb:bb': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\nbssid=bb:bb:bb:bb:bb:bb\nip_address=192.168.1.113\n',
+        }, {'ROAM': ['CTRL-EVENT-CONNECTED - Connection to bb:bb:bb:bb:bb:bb completed']})
+
+        self.assertIn('BSSID 0 bb:bb:bb:bb:bb:bb', commands)
+        self.assertIn('ROAM bb:bb:bb:bb:bb:bb', commands)
+        self.assertNotIn('SELECT_NETWORK 0', commands)
+        self.assertEqual(self.monitor.bssid, 'BB:BB:BB:BB:BB:BB')
+
+    def test_reassociate_when_roaming_fails(self):
+        commands = self.roam({
+            'ROAM': 'FAIL',
+            'REASSOCIATE': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\nbssid=bb:bb:bb:bb:bb:bb\nip_address=192.168.1.113\n',
+        }, {'REASSOCIATE': ['CTRL-EVENT-CONNECTED - Connection to bb:bb:bb:bb:bb:bb completed']})
+
+        self.assertIn('REASSOCIATE', commands)
+        self.assertEqual(self.monitor.bssid, 'BB:BB:BB:BB:BB:BB')
+
+    def test_stays_on_old_access_point(self):
+        self.assertRaises(ConnectionError, self.roam, {
+            'ROAM': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\nbssid=aa:aa:aa:aa:aa:aa\nip_address=192.168.1.113\n',
+        }, {'ROAM': ['CTRL-EVENT-CONNECTED - Connection to aa:aa:aa:aa:aa:aa completed']})
+        self.assertEqual(self.monitor.bssid, 'AA:AA:AA:AA:AA:AA')
@@ -0,0 +1,62 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import sys
+
+from wifi import Cell, Scheme
+from wifi import runner
+from wifi.runner import RecordingRunner, ReplayRunner
+import wifi.subprocess_compat as subprocess
+
+from tests.test_parsing import IWLIST_SCAN_NO_ENCRYPTION, IWLIST_SCAN_WEP
+from tests.test_schemes import SUCCESSFUL_IFUP_OUTPUT
+
+
+class RecordReplayTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.default = runner.get_runner()
+
+    def tearDown(self):
+        runner.set_runner(self.default)
+        shutil.rmtree(self.directory)
+
+    def test_record_and_replay(self):
+        recorder = RecordingRunner(self.directory, {'python': sys.executable})
+        self.assertEqual(recorder.run('python', ['-c', 'print("one")']).strip(), b'one')
+        self.assertRaises(subprocess.CalledProcessError,
+                          recorder.run, 'python', ['-c', 'import sys; sys.exit(2)'])
+
+        replay = ReplayRunner(self.directory, paths={'python': '/nonexistent'})
+        self.assertEqual(replay.run('python', ['-c', 'print("one")']).strip(), b'one')
+        self.assertRaises(subprocess.CalledProcessError,
+                          replay.run, 'python', ['-c', 'import sys; sys.exit(2)'])
+        self.assertRaises(OSError, replay.run, 'python', ['-c', 'pass'])
+
+    def test_replay_cycles_through_runs(self):
+        recorder = RecordingRunner(self.directory)
+        recorder.record('ifup', ['wlan0'], b'first', 0, 0.1)
+        recorder.record('ifup', ['wlan0'], b'second', 1, 0.1)
+
+        replay = ReplayRunner(self.directory)
+        self.assertEqual(replay.run('ifup', ['wlan0']), b'first')
+        self.assertRaises(subprocess.CalledProcessError, replay.run, 'ifup', ['wlan0'])
+        self.assertEqual(replay.run('ifup', ['wlan0']), b'first')
+
+    def test_replay_timeout(self):
+        RecordingRunner(self.directory).record('ifup', ['wlan0'], b'', 0, 10)
+        replay = ReplayRunner(self.directory, latency=1)
+        self.assertRaises(subprocess.TimeoutExpired, replay.run, 'ifup', ['wlan0'], 0.01)
+
+    def test_scan_and_connect_flow(self):
+        recorder = RecordingRunner(self.directory)
+        recorder.record('iwlist', ['wlan0', 'scan'],
+                        (IWLIST_SCAN_NO_ENCRYPTION + IWLIST_SCAN_WEP).encode('utf-8'), 0, 2)
+        recorder.record('ifdown', ['wlan0'], b'', 0, 0.5)
+        scheme = Scheme('wlan0', 'home', {'wireless-essid': 'WEP Network'})
+        recorder.record('ifup', scheme.as_args(), SUCCESSFUL_IFUP_OUTPUT.encode('utf-8'), 0, 3)
+
+        runner.set_runner(ReplayRunner(self.directory))
+        cells = Cell.all('wlan0')
+        self.assertEqual([cell.ssid for cell in cells], ['My Wireless Network', 'WEP Network'])
+        self.assertEqual(scheme.activate().ip_address, '192.168.1.113')
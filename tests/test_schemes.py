@@ -1,9 +1,15 @@
-from unittest import TestCase
+from unittest import TestCase, skipIf
 import tempfile
+import shutil
+import time
+import sys
 import os
 
 from wifi import Cell
-from wifi.scheme import extract_schemes, Scheme
+from wifi import runner
+from wifi.completion import index_path
+from wifi.scan import decode_ssid
+from wifi.scheme import extract_schemes, activate_first, Connection, Scheme
 from wifi.exceptions import ConnectionError
 
 
@@ -58,6 +64,8 @@ class TestSchemes(TestCase):
 
     def tearDown(self):
         os.remove(self.Scheme.interfaces)
+        if os.path.exists(index_path(self.Scheme.interfaces)):
+            os.remove(index_path(self.Scheme.interfaces))
 
     def test_scheme_extraction(self):
         work, coffee, home, coffee2 = list(extract_schemes(NETWORK_INTERFACES_FILE))[:4]
@@ -85,6 +93,11 @@ class TestSchemes(TestCase):
 
         self.assertEqual(str(scheme), 'iface wlan0-test inet dhcp\n    wpa-ssid workwifi\n')
 
+    def test_ssid(self):
+        self.assertEqual(self.Scheme.find('wlan0', 'work').ssid, 'workwifi')
+        self.assertEqual(self.Scheme.find('wlan0', 'coffee').ssid, 'Coffee WiFi')
+        self.assertIsNone(self.Scheme('wlan0', 'test').ssid)
+
     def test_find(self):
         work = self.Scheme.find('wlan0', 'work')
 
@@ -96,6 +109,66 @@ class TestSchemes(TestCase):
         self.assertIsNone(self.Scheme.find('wlan0', 'work'))
         assert self.Scheme.find('wlan0', 'coffee')
 
+    def test_delete_keeps_other_stanzas(self):
+        before = [(s.iface, s.options) for s in self.Scheme.all()]
+        self.Scheme.find('wlan0', 'coffee').delete()
+        after = [(s.iface, s.options) for s in self.Scheme.all()]
+        self.assertEqual(after, [pair for pair in before if pair[0] != 'wlan0-coffee'])
+        self.assertEqual(self.Scheme.find('wlan0', 'home').ssid, 'homewifi')
+
+    def test_find_doesnt_write_index(self):
+        self.assertIsNone(self.Scheme.find('wlan0', 'nope'))
+        self.assertFalse(os.path.exists(index_path(self.Scheme.interfaces)))
+
+        self.Scheme('wlan0', 'test').save()
+        with open(index_path(self.Scheme.interfaces), 'rb') as f:
+            index = f.read()
+        self.assertIsNone(self.Scheme.find('wlan0', 'nope'))
+        with open(index_path(self.Scheme.interfaces), 'rb') as f:
+            self.assertEqual(f.read(), index)
+
+    def test_find_after_hand_edit(self):
+        assert self.Scheme.find('wlan0', 'work')
+        with open(self.Scheme.interfaces, 'r+') as f:
+            content = f.read().replace('workwifi', 'officewifi')
+            f.seek(0)
+            f.write(content)
+        self.assertEqual(self.Scheme.find('wlan0', 'work').ssid, 'officewifi')
+        self.assertEqual(self.Scheme.find('wlan0', 'home').ssid, 'homewifi')
+
+    def edit_keeping_stat(self, edit):
+        """
+        Edits the interfaces file the way a filesystem with coarse
+        timestamps would show it: same inode, size and mtime.
+        """
+        stat = os.stat(self.Scheme.interfaces)
+        with open(self.Scheme.interfaces, 'r+') as f:
+            content = edit(f.read())
+            f.seek(0)
+            f.write(content)
+        if hasattr(stat, 'st_mtime_ns'):
+            os.utime(self.Scheme.interfaces, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(self.Scheme.interfaces, (stat.st_atime, stat.st_mtime))
+
+    def test_same_size_hand_edit(self):
+        assert self.Scheme.find('wlan0', 'work')
+        self.edit_keeping_stat(lambda content: content.replace('wlan0-work', 'wlan0-temp')
+                                                      .replace('wlan0-home', 'wlan0-work'))
+
+        self.assertEqual(self.Scheme.find('wlan0', 'work').ssid, 'homewifi')
+        self.assertEqual(self.Scheme.find('wlan0', 'temp').ssid, 'workwifi')
+        self.assertIsNone(self.Scheme.find('wlan0', 'home'))
+
+    def test_delete_after_same_size_hand_edit(self):
+        assert self.Scheme.find('wlan0', 'work')
+        self.edit_keeping_stat(lambda content: content.replace('wlan0-work', 'wlan0-temp')
+                                                      .replace('wlan0-home', 'wlan0-work'))
+
+        self.Scheme('wlan0', 'work').delete()
+        self.assertEqual([scheme.name for scheme in self.Scheme.all() if scheme.interface == 'wlan0'],
+                         ['temp', 'coffee', 'coffee2', 'with-hyphen'])
+
     def test_save(self):
         scheme = self.Scheme('wlan0', 'test')
         scheme.save()
@@ -115,6 +188,67 @@ class TestActivation(TestCase):
         self.assertRaises(ConnectionError, scheme.parse_ifup_output, FAILED_IFUP_OUTPUT)
 
 
+class FakeScheme(Scheme):
+    def activate(self, timeout=None):
+        self.timeout = timeout
+        if self.options.get('fail'):
+            raise ConnectionError("Failed to connect to %r" % self)
+        return Connection(scheme=self, ip_address='192.168.1.113')
+
+
+class TestActivateFirst(TestCase):
+    def test_failover(self):
+        broken = FakeScheme('wlan0', 'broken', {'fail': True})
+        working = FakeScheme('wlan0', 'working')
+
+        connection, attempts = activate_first([broken, working], attempt_timeout=5)
+
+        self.assertEqual(connection.scheme, working)
+        self.assertEqual([a.scheme for a in attempts], [broken, working])
+        self.assertFalse(attempts[0].succeeded)
+        self.assertIsInstance(attempts[0].error, ConnectionError)
+        self.assertTrue(attempts[1].succeeded)
+        self.assertEqual(working.timeout, 5)
+
+    def test_all_fail(self):
+        schemes = [FakeScheme('wlan0', str(i), {'fail': True}) for i in range(3)]
+
+        connection, attempts = activate_first(schemes)
+
+        self.assertIsNone(connection)
+        self.assertEqual(len(attempts), 3)
+
+    def test_attempt_timeout_bounded_by_total(self):
+        scheme = FakeScheme('wlan0', 'test')
+        activate_first([scheme], timeout=2, attempt_timeout=10)
+        self.assertTrue(0 < scheme.timeout <= 2)
+
+    def test_attempt_timeout_with_real_runner(self):
+        directory = tempfile.mkdtemp()
+        ifdown = os.path.join(directory, 'ifdown')
+        with open(ifdown, 'w') as f:
+            f.write('#!/bin/sh\nexec sleep 10\n')
+        os.chmod(ifdown, 0o755)
+
+        default = runner.get_runner()
+        runner.set_runner(runner.Runner({'ifdown': ifdown}))
+        try:
+            start = time.time()
+            connection, attempts = activate_first([Scheme('wlan0', 'home')], attempt_timeout=0.2)
+        finally:
+            runner.set_runner(default)
+            shutil.rmtree(directory)
+
+        self.assertLess(time.time() - start, 5)
+        self.assertIsNone(connection)
+        self.assertIsInstance(attempts[0].error, ConnectionError)
+
+    def test_expired_deadline(self):
+        connection, attempts = activate_first([FakeScheme('wlan0', 'test')], timeout=0)
+        self.assertIsNone(connection)
+        self.assertEqual(attempts, [])
+
+
 class TestForCell(TestCase):
     def test_unencrypted(self):
         cell = Cell()
@@ -188,6 +322,26 @@ class TestForCell(TestCase):
             'wireless-channel': 'auto',
         })
 
+    def test_psk_is_salted_with_ssid_bytes(self):
+        cell = Cell()
+        cell.ssid_bytes = b'SSID'
+        cell.ssid = u'something else'
+        cell.encrypted = True
+        cell.encryption_type = 'wpa2'
+
+        scheme = Scheme.for_cell('wlan0', 'test', cell, 'passkey')
+        self.assertEqual(scheme.options['wpa-psk'],
+                         'ea1548d4e8850c8d94c5ef9ed6fe483981b64c1436952cb1bf80c08a68cdc763')
+
+    @skipIf(sys.version_info[0] < 3, "SSIDs that aren't UTF-8 are decoded with replacement characters")
+    def test_ssid_not_utf8(self):
+        cell = Cell()
+        cell.ssid_bytes = b'Caf\xe9'
+        cell.ssid = decode_ssid(cell.ssid_bytes)
+        cell.encrypted = False
+
+        self.assertRaises(AssertionError, Scheme.for_cell, 'wlan0', 'test', cell)
+
 
 
 SUCCESSFUL_IFDOWN_OUTPUT = """Internet Systems Consortium DHCP Client 4.2.4
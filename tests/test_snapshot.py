@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from wifi import Cell
+from wifi.snapshot import HEADER, RECORD, Snapshot, dumps, load_all
+
+
+def make_cell(ssid, address, signal, channel, frequency_mhz, encryption_type=None, noise=None):
+    cell = Cell()
+    cell.ssid = ssid
+    cell.address = address
+    cell.signal = signal
+    cell.noise = noise
+    cell.channel = channel
+    cell.frequency_mhz = frequency_mhz
+    cell.encrypted = encryption_type is not None
+    cell.encryption_type = encryption_type
+    cell.mode = 'Master'
+    return cell
+
+
+CELLS = [
+    make_cell('homewifi', '00:11:22:33:44:55', -48, 6, 2437, 'wpa2', noise=-92),
+    make_cell('homewifi', '00:11:22:33:44:56', -67, 36, 5180, 'wpa2'),
+    make_cell(u'Caf\xe9', 'AA:BB:CC:DD:EE:FF', -80, 11, 2462),
+]
+
+
+class SnapshotTest(TestCase):
+    def test_size(self):
+        data = dumps(CELLS, 'wlan0', 1500000000.5)
+        # Both access points of homewifi share one SSID in the table.
+        self.assertEqual(len(data), HEADER.size + 3 * RECORD.size + len(b'homewifi') + len(u'Caf\xe9'.encode('utf-8')))
+
+    def test_header(self):
+        snapshot = Snapshot(dumps(CELLS, 'wlan0', 1500000000.5))
+        self.assertEqual(snapshot.timestamp, 1500000000.5)
+        self.assertEqual(snapshot.interface, 'wlan0')
+        self.assertEqual(len(snapshot), 3)
+
+    def test_records(self):
+        first, second, third = Snapshot(dumps(CELLS, 'wlan0')).records()
+        self.assertEqual(first.bssid, b'\x00\x11\x22\x33\x44\x55')
+        self.assertEqual(first.ssid, b'homewifi')
+        self.assertEqual((first.signal, first.noise, first.channel, first.frequency_mhz), (-48, -92, 6, 2437))
+        self.assertIsNone(second.noise)
+        self.assertEqual(third.ssid, u'Caf\xe9'.encode('utf-8'))
+
+    def test_cells_round_trip(self):
+        cells = list(Snapshot(dumps(CELLS, 'wlan0')).cells())
+        for cell, original in zip(cells, CELLS):
+            for name in ('ssid', 'address', 'signal', 'noise', 'channel', 'frequency_mhz',
+                         'encrypted', 'encryption_type', 'mode'):
+                self.assertEqual(getattr(cell, name), getattr(original, name))
+        self.assertEqual(cells[0].frequency, '2.437 GHz')
+
+    def test_missing_values(self):
+        cell = Cell()
+        cell.ssid = ''
+        restored, = Snapshot(dumps([cell], 'wlan0')).cells()
+        self.assertIsNone(restored.address)
+        self.assertIsNone(restored.signal)
+        self.assertIsNone(restored.channel)
+        self.assertFalse(restored.encrypted)
+
+    def test_archive(self):
+        data = dumps(CELLS, 'wlan0', 1) + dumps(CELLS[:1], 'wlan1', 2)
+        snapshots = list(load_all(data))
+        self.assertEqual([(s.interface, len(s)) for s in snapshots], [('wlan0', 3), ('wlan1', 1)])
+        self.assertEqual([r.ssid for r in snapshots[1]], [b'homewifi'])
+
+    def test_bad_data(self):
+        self.assertRaises(ValueError, Snapshot, b'X' * HEADER.size)
+        data = bytearray(dumps(CELLS, 'wlan0'))
+        data[4] = 99
+        self.assertRaises(ValueError, Snapshot, data)
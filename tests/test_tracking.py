@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from wifi import Cell
+from wifi.tracking import CellTracker
+
+
+def make_cell(address, signal, ssid='homewifi'):
+    cell = Cell()
+    cell.ssid = ssid
+    cell.address = address
+    cell.signal = signal
+    return cell
+
+
+class CellTrackerTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.tracker = CellTracker(alpha=0.5, max_age=60, max_bssids=2, clock=lambda: self.now)
+
+    def test_smoothing(self):
+        for signal in (-60, -80, -60):
+            self.tracker.update([make_cell('AA', signal)])
+
+        stats = self.tracker.get('AA')
+        self.assertEqual(stats.mean, -65)
+        self.assertEqual(stats.min, -80)
+        self.assertEqual(stats.max, -60)
+        self.assertEqual(stats.count, 3)
+        self.assertTrue(stats.variance > 0)
+        self.assertEqual(self.tracker.signal(make_cell('AA', -90)), -65)
+        self.assertEqual(self.tracker.signal(make_cell('BB', -90)), -90)
+
+    def test_evicts_by_age(self):
+        self.tracker.update([make_cell('AA', -60)])
+        self.now = 30
+        self.tracker.update([make_cell('BB', -60)])
+        self.now = 61
+        self.tracker.update([])
+        self.assertIsNone(self.tracker.get('AA'))
+        self.assertIsNotNone(self.tracker.get('BB'))
+
+    def test_bounded(self):
+        for i, address in enumerate(['AA', 'BB', 'CC']):
+            self.now = i
+            self.tracker.update([make_cell(address, -60)])
+        self.assertEqual(len(self.tracker), 2)
+        self.assertIsNone(self.tracker.get('AA'))
+
+    def test_ranked(self):
+        self.tracker.max_bssids = 3
+        self.tracker.update([make_cell('AA', -70), make_cell('BB', -50), make_cell('CC', -40, 'other')])
+        self.assertEqual([s.cell.address for s in self.tracker.ranked('homewifi')], ['BB', 'AA'])
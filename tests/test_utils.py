@@ -2,13 +2,17 @@
 from __future__ import unicode_literals
 
 from unittest import TestCase
+import os
+import sys
+import time
 
 try:
     from io import StringIO
 except ImportError:  # Python < 3
     from StringIO import StringIO
 
-from wifi.utils import print_table, match, db2dbm
+from wifi.utils import InternTable, print_table, match, db2dbm
+import wifi.subprocess_compat as subprocess
 
 
 print_table_in = [
@@ -32,6 +36,11 @@ class PrintTableTest(TestCase):
         print_table([[1], ['2']], file=stdout)
         self.assertEqual(stdout.getvalue(), '1\n2\n')
 
+    def test_none(self):
+        stdout = StringIO()
+        print_table([[None, 'a'], [-50, 'b']], file=stdout)
+        self.assertEqual(stdout.getvalue(), 'None  a\n-50   b\n')
+
 
 class FuzzyMatchTest(TestCase):
     def test_match(self):
@@ -52,3 +61,76 @@ class db2dbMTest(TestCase):
         self.assertEqual(db2dbm(100), -50)
         self.assertEqual(db2dbm(101), -50)
         self.assertEqual(db2dbm(200), -50)
+
+
+class InternTableTest(TestCase):
+    def test_shares_equal_values(self):
+        table = InternTable()
+        first = table(''.join(['home', 'wifi']))
+        self.assertIs(table(''.join(['homew', 'ifi'])), first)
+
+    def test_make(self):
+        table = InternTable()
+        value = table(('1 Mb/s',), lambda key: key + ('made',))
+        self.assertEqual(value, ('1 Mb/s', 'made'))
+        self.assertIs(table(('1 Mb/s',), lambda key: None), value)
+
+    def test_least_recently_used_are_evicted(self):
+        table = InternTable(maxsize=2)
+        # New tuples each time, rather than shared constants.
+        key = lambda name: tuple([name])
+        a, b = table(key('a')), table(key('b'))
+        table(key('a'))
+        table(key('c'))
+        self.assertEqual(len(table), 2)
+        self.assertIs(table(key('a')), a)
+        self.assertIsNot(table(key('b')), b)
+
+
+class TraceHooksTest(TestCase):
+    def test_hooks_see_every_command(self):
+        calls = []
+        hook = lambda *args: calls.append(args)
+        subprocess.add_hook(hook)
+        try:
+            subprocess.check_output([sys.executable, '-c', 'print("hi")'])
+            self.assertRaises(subprocess.CalledProcessError, subprocess.check_output,
+                              [sys.executable, '-c', 'import sys; sys.exit(3)'])
+        finally:
+            subprocess.remove_hook(hook)
+
+        (argv, duration, output_bytes, returncode), failure = calls
+        self.assertEqual(argv[0], sys.executable)
+        self.assertTrue(duration > 0)
+        self.assertEqual(output_bytes, len('hi' + os.linesep))
+        self.assertEqual(returncode, 0)
+        self.assertEqual(failure[3], 3)
+
+    def test_collector(self):
+        with subprocess.TraceCollector() as collector:
+            subprocess.check_output([sys.executable, '-c', ''])
+            subprocess.check_output([sys.executable, '-c', ''])
+        subprocess.check_output([sys.executable, '-c', ''])
+
+        [(program, stats)] = collector.summary()
+        self.assertEqual(program, sys.executable)
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['failures'], 0)
+
+        stderr = StringIO()
+        collector.print_summary(file=stderr)
+        self.assertTrue(stderr.getvalue().startswith('program'))
+
+
+class WatchdogTest(TestCase):
+    def test_kills_command_after_timeout(self):
+        start = time.time()
+        self.assertRaises(subprocess.TimeoutExpired, subprocess.watchdog_check_output,
+                          [sys.executable, '-c', 'import time; time.sleep(10)'], timeout=0.2)
+        self.assertLess(time.time() - start, 5)
+
+    def test_finishes_in_time(self):
+        output = subprocess.watchdog_check_output([sys.executable, '-c', 'print("hi")'], timeout=10)
+        self.assertEqual(output.strip(), b'hi')
+        self.assertRaises(subprocess.CalledProcessError, subprocess.watchdog_check_output,
+                          [sys.executable, '-c', 'import sys; sys.exit(3)'], timeout=10)
@@ -0,0 +1,363 @@
+from unittest import TestCase
+import tempfile
+import threading
+import shutil
+import socket
+import os
+
+from wifi import Cell
+from wifi.scan import decode_ssid
+from wifi.wpa_supplicant import Control, NetworkScheme, parse_bss, scan
+from wifi.exceptions import ConnectionError, InterfaceError
+
+
+BSSES = [
+    ['00:11:22:33:44:55', '2437', '-48', '[WPA2-PSK-CCMP][ESS]', 'homewifi'],
+    ['aa:bb:cc:dd:ee:ff', '5180', '-71', '[WEP][ESS]', 'Coffee WiFi'],
+    ['02:00:00:00:00:01', '2412', '-80', '[IBSS]', ''],
+]
+
+
+def bss_reply(i, bssid, frequency, signal, flags, ssid):
+    return 'id={0}\nbssid={1}\nfreq={2}\nlevel={3}\nflags={4}\nssid={5}\n'.format(
+        i, bssid, frequency, signal, flags, ssid)
+
+
+class FakeSupplicant(object):
+    """
+    Answers control interface commands from `replies` on a Unix datagram
+    socket in `directory`, and follows them with the `events` for the
+    command.  Replies and events are looked up by the whole command, then
+    by its first word.  ``BSS`` requests are answered from `bsses`.
+
+    Like wpa_supplicant, replies are cut short at 4096 bytes.
+    """
+
+    def __init__(self, directory, interface='wlan0', replies=None, events=None, bsses=BSSES):
+        self.path = os.path.join(directory, interface)
+        self.bsses = bsses
+        self.replies = dict({'ATTACH': 'OK', 'DETACH': 'OK', 'SCAN': 'OK'}, **(replies or {}))
+        self.events = dict({'SCAN': ['CTRL-EVENT-SCAN-STARTED ', 'CTRL-EVENT-SCAN-RESULTS ']},
+                           **(events or {}))
+        self.commands = []
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(4096)
+            except socket.error:
+                return
+            command = data.decode('utf-8')
+            self.commands.append(command)
+            if command.startswith('BSS '):
+                reply = self.bss(command.split(' ')[1])
+            else:
+                reply = self.lookup(self.replies, command, 'UNKNOWN COMMAND') + '\n'
+            self.socket.sendto(reply.encode('utf-8')[:4096], address)
+            for event in self.lookup(self.events, command, []):
+                self.socket.sendto(b'<2>' + event.encode('utf-8'), address)
+
+    def bss(self, which):
+        if which == 'FIRST':
+            i = 0
+        elif which.startswith('NEXT-'):
+            i = int(which[len('NEXT-'):]) + 1
+        else:
+            return ''
+        if i >= len(self.bsses):
+            return ''
+        return bss_reply(i, *self.bsses[i])
+
+    def lookup(self, table, command, default):
+        return table.get(command, table.get(command.split(' ')[0], default))
+
+    def close(self):
+        self.socket.close()
+
+
+class ParseBSSTest(TestCase):
+    def test_parse(self):
+        home, coffee, adhoc = [parse_bss(bss_reply(i, *bss)) for i, bss in enumerate(BSSES)]
+
+        self.assertEqual(home.address, '00:11:22:33:44:55')
+        self.assertEqual(home.ssid, 'homewifi')
+        self.assertEqual(home.signal, -48)
+        self.assertEqual(home.frequency, '2.437 GHz')
+        self.assertEqual(home.frequency_mhz, 2437)
+        self.assertEqual(home.channel, 6)
+        self.assertTrue(home.encrypted)
+        self.assertEqual(home.encryption_type, 'wpa2')
+        self.assertEqual(home.mode, 'Master')
+
+        self.assertEqual(coffee.ssid, 'Coffee WiFi')
+        self.assertEqual(coffee.channel, 36)
+        self.assertEqual(coffee.encryption_type, 'wep')
+
+        self.assertEqual(adhoc.ssid, '')
+        self.assertFalse(adhoc.encrypted)
+        self.assertEqual(adhoc.mode, 'Ad-Hoc')
+
+    def test_escaped_ssid(self):
+        cell = parse_bss(bss_reply(0, '00:11:22:33:44:55', '2437', '-48', '[ESS]',
+                                   'Caf\\xc3\\xa9 \\"5\\\\G\\"'))
+        self.assertEqual(cell.ssid_bytes, u'Caf\xe9 "5\\G"'.encode('utf-8'))
+        self.assertEqual(cell.ssid, u'Caf\xe9 "5\\G"')
+
+    def test_no_such_bss(self):
+        self.assertIsNone(parse_bss(''))
+
+
+class ControlTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            cells = scan('wlan0', self.directory, timeout=2)
+        finally:
+            supplicant.close()
+
+        self.assertEqual([cell.ssid for cell in cells], ['homewifi', 'Coffee WiFi', ''])
+        self.assertEqual(cells[0].signal, -48)
+        self.assertEqual(cells[0].encryption_type, 'wpa2')
+        self.assertEqual(cells[1].channel, 36)
+        self.assertEqual(cells[2].mode, 'Ad-Hoc')
+        self.assertEqual(supplicant.commands, ['ATTACH', 'SCAN', 'DETACH', 'BSS FIRST MASK=0x1887',
+                                               'BSS NEXT-0 MASK=0x1887', 'BSS NEXT-1 MASK=0x1887',
+                                               'BSS NEXT-2 MASK=0x1887'])
+
+    def test_scan_busy_site(self):
+        bsses = [['00:11:22:33:44:{0:02x}'.format(i), '2437', '-60', '[WPA2-PSK-CCMP][ESS]',
+                  'network {0}'.format(i)] for i in range(100)]
+        supplicant = FakeSupplicant(self.directory, bsses=bsses)
+        try:
+            cells = scan('wlan0', self.directory, timeout=2)
+        finally:
+            supplicant.close()
+        self.assertEqual([cell.ssid for cell in cells], ['network {0}'.format(i) for i in range(100)])
+
+    def test_scan_channels(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            cells = scan('wlan0', self.directory, timeout=2, channels=[1, 6, 11])
+        finally:
+            supplicant.close()
+        self.assertEqual([cell.ssid for cell in cells], ['homewifi', ''])
+        self.assertIn('SCAN freq=2412,2437,2462', supplicant.commands)
+
+    def test_scan_band(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            cells = scan('wlan0', self.directory, timeout=2, band='5')
+        finally:
+            supplicant.close()
+        self.assertEqual([cell.ssid for cell in cells], ['Coffee WiFi'])
+        self.assertIn('SCAN freq=5000-5900', supplicant.commands)
+
+    def test_scan_while_busy(self):
+        supplicant = FakeSupplicant(self.directory, replies={'SCAN': 'FAIL-BUSY'})
+        try:
+            cells = scan('wlan0', self.directory, timeout=2)
+        finally:
+            supplicant.close()
+        self.assertEqual(len(cells), 3)
+
+    def test_last_results(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            cells = scan('wlan0', self.directory, fresh=False, timeout=2)
+        finally:
+            supplicant.close()
+        self.assertEqual(len(cells), 3)
+        self.assertNotIn('SCAN', supplicant.commands)
+
+    def test_scan_timeout(self):
+        supplicant = FakeSupplicant(self.directory, events={'SCAN': []})
+        try:
+            self.assertRaises(InterfaceError, scan, 'wlan0', self.directory, timeout=0.2)
+        finally:
+            supplicant.close()
+
+    def test_scan_failure(self):
+        supplicant = FakeSupplicant(self.directory, replies={'SCAN': 'FAIL'})
+        try:
+            self.assertRaises(InterfaceError, scan, 'wlan0', self.directory, timeout=2)
+        finally:
+            supplicant.close()
+
+    def test_no_supplicant(self):
+        self.assertRaises(InterfaceError, scan, 'wlan0', self.directory)
+
+    def test_control_socket_is_removed(self):
+        supplicant = FakeSupplicant(self.directory)
+        try:
+            control = Control(supplicant.path, timeout=2)
+            self.assertEqual(control.request('PING'), 'UNKNOWN COMMAND')
+            control.close()
+        finally:
+            supplicant.close()
+        self.assertFalse(os.path.exists(control.local))
+
+
+NETWORKS = """ctrl_interface=/var/run/wpa_supplicant
+
+network={
+    id_str="wlan0-home"
+    ssid="homewifi"
+    psk=9d1e4a2e7a3a1b0c
+    key_mgmt=WPA-PSK
+}
+
+network={
+    ssid="unmanaged"
+    key_mgmt=NONE
+}
+
+network={
+    id_str="wlan0-coffee"
+    ssid=436f666665652057694669
+    key_mgmt=NONE
+}
+"""
+
+LIST_NETWORKS = 'network id / ssid / bssid / flags\n0\thomewifi\tany\t\n1\tunmanaged\tany\t\n'
+
+
+class NetworkSchemeTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = os.path.join(self.directory, 'wpa_supplicant.conf')
+        with open(self.config, 'w') as f:
+            f.write(NETWORKS)
+        self.Scheme = NetworkScheme.for_file(self.config)
+        self.Scheme.ctrl_dir = self.directory
+        self.Scheme.poll_interval = 0.01
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_all(self):
+        home, coffee = self.Scheme.all()
+        self.assertEqual((home.interface, home.name), ('wlan0', 'home'))
+        self.assertEqual(home.options, {'ssid': '"homewifi"', 'psk': '9d1e4a2e7a3a1b0c', 'key_mgmt': 'WPA-PSK'})
+        self.assertEqual(home.ssid, 'homewifi')
+        self.assertEqual(coffee.ssid, 'Coffee WiFi')
+
+    def test_save_and_find(self):
+        cell = Cell()
+        cell.ssid = 'Work "5G"'
+        cell.encrypted = False
+        self.Scheme.for_cell('wlan0', 'work', cell).save()
+
+        work = self.Scheme.find('wlan0', 'work')
+        self.assertEqual(work.ssid, 'Work "5G"')
+        self.assertEqual(work.options['key_mgmt'], 'NONE')
+        self.assertRaises(AssertionError, work.save)
+
+    def test_wpa_for_cell(self):
+        cell = Cell()
+        cell.ssid = 'homewifi'
+        cell.encrypted = True
+        cell.encryption_type = 'wpa2'
+        scheme = self.Scheme.for_cell('wlan0', 'home', cell, 'a' * 64)
+        self.assertEqual(scheme.options, {'ssid': '"homewifi"', 'psk': 'a' * 64, 'key_mgmt': 'WPA-PSK'})
+
+    def test_ssid_not_utf8(self):
+        cell = Cell()
+        cell.ssid_bytes = b'Caf\xe9'
+        cell.ssid = decode_ssid(cell.ssid_bytes)
+        cell.encrypted = True
+        cell.encryption_type = 'wpa2'
+        scheme = self.Scheme.for_cell('wlan0', 'cafe', cell, 'passkey')
+        self.assertEqual(scheme.options['ssid'], '436166e9')
+        self.assertEqual(len(scheme.options['psk']), 64)
+
+        scheme.save()
+        self.assertEqual(self.Scheme.find('wlan0', 'cafe').ssid, cell.ssid)
+
+    def test_delete(self):
+        self.Scheme.find('wlan0', 'home').delete()
+
+        self.assertEqual([scheme.name for scheme in self.Scheme.all()], ['coffee'])
+        with open(self.config) as f:
+            content = f.read()
+        self.assertIn('ctrl_interface=/var/run/wpa_supplicant', content)
+        self.assertIn('ssid="unmanaged"', content)
+
+    def test_activate(self):
+        supplicant = FakeSupplicant(self.directory, replies={
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK 0 id_str': '"wlan0-home"',
+            'GET_NETWORK 1 id_str': 'FAIL',
+            'SELECT_NETWORK 0': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\nssid=homewifi\nip_address=192.168.1.113\n',
+        }, events={'SELECT_NETWORK': ['CTRL-EVENT-CONNECTED - Connection to 00:11:22:33:44:55 completed']})
+        try:
+            connection = self.Scheme.find('wlan0', 'home').activate(timeout=2)
+        finally:
+            supplicant.close()
+
+        self.assertEqual(connection.ip_address, '192.168.1.113')
+        self.assertEqual(set(connection.timings), set(['associate', 'dhcp']))
+        self.assertNotIn('RECONFIGURE', supplicant.commands)
+
+    def test_activate_current_network(self):
+        # wpa_supplicant sends no event when the network is already up.
+        supplicant = FakeSupplicant(self.directory, replies={
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK 0 id_str': '"wlan0-home"',
+            'SELECT_NETWORK 0': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\nid_str=wlan0-home\nip_address=192.168.1.113\n',
+        })
+        try:
+            connection = self.Scheme.find('wlan0', 'home').activate(timeout=1)
+        finally:
+            supplicant.close()
+        self.assertEqual(connection.ip_address, '192.168.1.113')
+
+    def test_activate_unknown_network_reconfigures(self):
+        supplicant = FakeSupplicant(self.directory, replies={
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK': 'FAIL',
+            'RECONFIGURE': 'OK',
+        })
+        try:
+            self.assertRaises(ConnectionError, self.Scheme.find('wlan0', 'coffee').activate, 2)
+        finally:
+            supplicant.close()
+        self.assertIn('RECONFIGURE', supplicant.commands)
+
+    def test_activate_wrong_key(self):
+        supplicant = FakeSupplicant(self.directory, replies={
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK 0 id_str': '"wlan0-home"',
+            'SELECT_NETWORK 0': 'OK',
+        }, events={'SELECT_NETWORK': ['CTRL-EVENT-SSID-TEMP-DISABLED id=0 ssid="homewifi" reason=WRONG_KEY']})
+        try:
+            self.assertRaises(ConnectionError, self.Scheme.find('wlan0', 'home').activate, 2)
+        finally:
+            supplicant.close()
+
+    def test_activate_without_address_times_out(self):
+        supplicant = FakeSupplicant(self.directory, replies={
+            'LIST_NETWORKS': LIST_NETWORKS,
+            'GET_NETWORK 0 id_str': '"wlan0-home"',
+            'SELECT_NETWORK 0': 'OK',
+            'STATUS': 'wpa_state=COMPLETED\n',
+        }, events={'SELECT_NETWORK': ['CTRL-EVENT-CONNECTED - Connection completed']})
+        try:
+            self.assertRaises(ConnectionError, self.Scheme.find('wlan0', 'home').activate, 0.2)
+        finally:
+            supplicant.close()
+
+    def test_activate_without_supplicant(self):
+        self.assertRaises(ConnectionError, self.Scheme.find('wlan0', 'home').activate, 1)
@@ -1,2 +1,31 @@
-from wifi.scan import Cell
-from wifi.scheme import Scheme
+"""
+Cell and Scheme are imported when they are first used, so that the wifi
+command's shell completion doesn't pay for them.
+"""
+import importlib
+import sys
+
+__all__ = ['Cell', 'Scheme']
+
+_lazy = {
+    'Cell': 'wifi.scan',
+    'Scheme': 'wifi.scheme',
+}
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_lazy[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
+
+
+# Modules can only have __getattr__ from Python 3.7.
+if sys.version_info < (3, 7):
+    from wifi.scan import Cell
+    from wifi.scheme import Scheme
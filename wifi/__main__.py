@@ -1,2 +1,19 @@
-from .cli import main
-main()
+import os
+
+
+def main():
+    """
+    The entry point of the wifi command.  Completion is answered before
+    :mod:`wifi.cli` is imported, since it runs on every TAB press.
+    """
+    if 'WIFI_AUTOCOMPLETE' in os.environ:
+        from wifi.completion import print_completion
+        print_completion()
+        return
+
+    from wifi.cli import main
+    main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Works out how busy each channel is from a scan and which channel is the
+least congested.
+
+Interference is the sum of the received power (in mW) of every network,
+weighted by how much its channel overlaps the channel in question.  In
+the 2.4 GHz band channels are 5 MHz apart but 20 MHz wide, so a network
+also interferes with the four channels on either side of its own; 5 GHz
+channels don't overlap.
+
+NumPy is used to do the arithmetic when it's installed.
+"""
+from __future__ import division
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CHANNELS_24GHZ = list(range(1, 12))
+CHANNELS_5GHZ = [36, 40, 44, 48, 52, 56, 60, 64, 100, 104, 108, 112, 116, 120,
+                 124, 128, 132, 136, 140, 149, 153, 157, 161, 165]
+
+# How much a 2.4 GHz network interferes with a channel that is 0, 1, 2, ...
+# channels away from its own.
+OVERLAP_24GHZ = (1.0, 0.8, 0.6, 0.4, 0.2)
+
+
+def overlap(a, b):
+    """
+    Returns the fraction of channel `a` that channel `b` overlaps.
+    """
+    if a > 14 or b > 14:
+        return 1.0 if a == b else 0.0
+    distance = abs(a - b)
+    return OVERLAP_24GHZ[distance] if distance < len(OVERLAP_24GHZ) else 0.0
+
+
+def dbm2mw(dbm):
+    return 10 ** (dbm / 10)
+
+
+def mw2dbm(mw):
+    return 10 * math.log10(mw) if mw > 0 else None
+
+
+def occupancy(cells):
+    """
+    Returns a dictionary of the number of networks on each channel.
+    """
+    counts = {}
+    for cell in cells:
+        if cell.channel is not None:
+            counts[cell.channel] = counts.get(cell.channel, 0) + 1
+    return counts
+
+
+def interference(cells, channels=CHANNELS_24GHZ):
+    """
+    Returns a dictionary of the interference (in mW) on each of
+    `channels`.
+    """
+    cells = [cell for cell in cells if cell.channel is not None and cell.signal is not None]
+    if numpy is not None and cells:
+        return _interference_numpy(cells, channels)
+
+    return dict(
+        (channel, sum(overlap(channel, cell.channel) * dbm2mw(cell.signal) for cell in cells))
+        for channel in channels
+    )
+
+
+def _interference_numpy(cells, channels):
+    candidates = numpy.array(channels)
+    cell_channels = numpy.array([cell.channel for cell in cells])
+    power = 10 ** (numpy.array([cell.signal for cell in cells], dtype=float) / 10)
+
+    distance = numpy.abs(candidates[:, None] - cell_channels[None, :])
+    weights = numpy.take(OVERLAP_24GHZ + (0.0,), numpy.minimum(distance, len(OVERLAP_24GHZ)))
+    # 5 GHz channels only interfere with themselves.
+    is_5ghz = (candidates[:, None] > 14) | (cell_channels[None, :] > 14)
+    weights = numpy.where(is_5ghz, (distance == 0).astype(float), weights)
+
+    return dict(zip(channels, (weights * power).sum(axis=1).tolist()))
+
+
+def recommend_channel(cells, channels=CHANNELS_24GHZ):
+    """
+    Returns the least congested of `channels`.  Ties go to the channel
+    with fewer networks on it, then to the lowest channel.
+    """
+    cells = list(cells)
+    scores = interference(cells, channels)
+    counts = occupancy(cells)
+    return min(channels, key=lambda channel: (scores[channel], counts.get(channel, 0), channel))
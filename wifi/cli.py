@@ -1,12 +1,15 @@
 #!/usr/bin/python
 from __future__ import print_function
-import argparse
 import sys
 import os
 
-from wifi import Cell, Scheme
+from wifi import Cell, Scheme, metrics
+from wifi.scan import block_filter, escape_ssid, spectrum_filter, strongest
+from wifi.scheme import activate_first, rank_available
+from wifi.completion import print_completion
+from wifi.subprocess_compat import TraceCollector, add_hook
 from wifi.utils import print_table, match as fuzzy_match
-from wifi.exceptions import ConnectionError, InterfaceError
+from wifi.exceptions import ConnectionError, DaemonError, InterfaceError
 
 try:  # Python 2.x
     input = raw_input
@@ -14,10 +17,11 @@ except NameError:
     pass
 
 
-def fuzzy_find_cell(interface, query):
-    match_partial = lambda cell: fuzzy_match(query, cell.ssid)
-
-    matches = Cell.where(interface, match_partial)
+def fuzzy_find_cell(cells, query):
+    matches = [cell for cell in cells if fuzzy_match(query, cell.ssid)]
+    exact = [cell for cell in matches if cell.ssid.lower() == query.lower()]
+    if exact:
+        matches = exact
 
     num_unique_matches = len(set(cell.ssid for cell in matches))
     assert num_unique_matches > 0, "Couldn't find a network that matches '{}'".format(query)
@@ -30,29 +34,153 @@ def fuzzy_find_cell(interface, query):
     return matches[0]
 
 
-def find_cell(interface, query):
-    cell = Cell.where(interface, lambda cell: cell.ssid.lower() == query.lower())
-
-    try:
-        cell = cell[0]
-    except IndexError:
-        cell = fuzzy_find_cell(interface, query)
-    return cell
+def find_cell(interface, query, probe=True):
+    """
+    Finds the network that `query` names.  With `probe`, `query` is taken
+    to be an SSID and probed for by name before scanning for every network.
+    """
+    if probe:
+        cell = strongest(Cell.probe(interface, query))
+        if cell is not None:
+            return cell
+    return fuzzy_find_cell(Cell.all(interface), query)
 
 
 def get_scheme_params(interface, scheme, ssid=None):
-    cell = find_cell(interface, ssid or scheme)
+    # Only an SSID is worth probing for, not a nickname.
+    cell = find_cell(interface, ssid or scheme, probe=ssid is not None)
     passkey = None if not cell.encrypted else input('passkey> ')
 
     return interface, scheme, cell, passkey
 
 
+def daemon_client(args):
+    """
+    Returns a client for the wifi daemon, or `None` if it isn't running.
+    """
+    # The daemon doesn't keep a history, so don't bypass it.
+    if args.history or not os.path.exists(args.socket):
+        return None
+
+    import socket
+    from wifi.daemon import Client
+    try:
+        return Client(args.socket, args.interface, args.file)
+    except socket.error:
+        return None
+
+
+scan_fields = {
+    'signal': lambda cell: cell.signal,
+    'ssid': lambda cell: escape_ssid(cell.ssid),
+    'protection': lambda cell: 'protected' if cell.encrypted else 'unprotected',
+    'bssid': lambda cell: cell.address,
+    'channel': lambda cell: cell.channel,
+    'frequency': lambda cell: cell.frequency,
+    'quality': lambda cell: cell.quality,
+    'encrypted': lambda cell: cell.encrypted,
+    'encryption': lambda cell: cell.encryption_type,
+    'mode': lambda cell: cell.mode,
+    'noise': lambda cell: cell.noise,
+}
+
+default_scan_fields = ['signal', 'ssid', 'protection']
+
+
+def channel_list(value):
+    return [int(channel) for channel in value.split(',')]
+
+
+def fields(value):
+    names = value.split(',')
+    for name in names:
+        if name not in scan_fields:
+            raise ValueError(name)
+    return names
+
+
+def scan_cells(args):
+    """
+    Scans with wpa_supplicant when ``--wpa-supplicant`` is given, or with
+    iwlist.  With ``--cached``, the results of the last scan are used.
+    Only the networks on ``--channels`` and in ``--band`` are returned.
+    """
+    fresh = not getattr(args, 'cached', False)
+    channels = getattr(args, 'channels', None)
+    band = getattr(args, 'band', None)
+    if getattr(args, 'wpa_supplicant', None):
+        from wifi import wpa_supplicant
+        return wpa_supplicant.scan(args.interface, args.wpa_supplicant, fresh=fresh,
+                                   channels=channels, band=band)
+    return Cell.iterate(args.interface, block_filter(channels=channels, band=band), fresh=fresh)
+
+
+def daemon_scan(client, args):
+    """
+    Asks the daemon to scan with the backend the command was given.
+    """
+    return client.scan(ctrl_dir=getattr(args, 'wpa_supplicant', None), last=getattr(args, 'cached', False))
+
+
 def scan_command(args):
-    print_table([[cell.signal, cell.ssid, 'protected' if cell.encrypted else 'unprotected'] for cell in Cell.all(args.interface)])
+    client = daemon_client(args)
+    cells = daemon_scan(client, args) if client else scan_cells(args)
+    allowed = spectrum_filter(getattr(args, 'channels', None), getattr(args, 'band', None))
+    if client and allowed:
+        cells = [cell for cell in cells if allowed(cell.frequency_mhz, cell.channel)]
+    names = getattr(args, 'fields', None) or default_scan_fields
+    rows = ([scan_fields[name](cell) for name in names] for cell in cells)
+    format = getattr(args, 'format', 'table')
+
+    if format == 'table':
+        # The widths of the columns depend on every row.
+        print_table(list(rows))
+    elif format == 'json':
+        import json
+        print(json.dumps([dict(zip(names, row)) for row in rows], indent=2))
+    elif format == 'ndjson':
+        import json
+        for row in rows:
+            print(json.dumps(dict(zip(names, row))))
+            sys.stdout.flush()
+    elif format == 'csv':
+        import csv
+        writer = csv.writer(sys.stdout)
+        writer.writerow(names)
+        for row in rows:
+            writer.writerow(row)
+            sys.stdout.flush()
+
+
+def channels_command(args):
+    from wifi import analysis
+
+    client = daemon_client(args)
+    cells = daemon_scan(client, args) if client else list(scan_cells(args))
+    channels = analysis.CHANNELS_5GHZ if args.band == '5' else analysis.CHANNELS_24GHZ
+    recommended = analysis.recommend_channel(cells, channels)
+
+    if args.recommend:
+        print(recommended)
+        return
+
+    counts = analysis.occupancy(cells)
+    scores = analysis.interference(cells, channels)
+    rows = [['channel', 'networks', 'interference']]
+    for channel in channels:
+        dbm = analysis.mw2dbm(scores[channel])
+        rows.append([
+            channel,
+            counts.get(channel, 0),
+            '-' if dbm is None else '%.1f dBm' % dbm,
+        ])
+    print_table(rows)
+    print('Least congested channel: {0}'.format(recommended))
 
 
 def list_command(args):
-    for scheme in Scheme.for_file(args.file).all():
+    client = daemon_client(args)
+    for scheme in client.all() if client else Scheme.for_file(args.file).all():
         print(scheme.name)
 
 
@@ -69,8 +197,31 @@ def add_command(args):
     scheme.save()
 
 
+def open_history(args):
+    if args.history:
+        # sqlite3 is only imported when the history is actually used.
+        from wifi.history import History
+        return History(args.history)
+
+
+def history_cell(args, scheme):
+    """
+    Finds the cell that `scheme` is about to connect to, for the history,
+    or returns `None` if it can't be found.
+    """
+    if not scheme.ssid:
+        return None
+    try:
+        if getattr(args, 'wpa_supplicant', None):
+            return strongest([cell for cell in scan_cells(args) if cell.ssid == scheme.ssid])
+        return Cell.find(args.interface, scheme.ssid)
+    except InterfaceError:
+        return None
+
+
 def connect_command(args):
     scheme_class = Scheme.for_file(args.file)
+    cell = None
     if args.adhoc:
         # ensure that we have the adhoc utility scheme
         try:
@@ -81,35 +232,82 @@ def connect_command(args):
         except IOError:
             assert False, "Can't write on {0!r}, do you have required privileges?".format(args.file)
 
-        scheme = scheme_class.for_cell(*get_scheme_params(args.interface, 'adhoc', args.scheme))
+        params = get_scheme_params(args.interface, 'adhoc', args.scheme)
+        scheme = scheme_class.for_cell(*params)
+        cell = params[2]
     else:
+        client = daemon_client(args)
+        if client:
+            client.connect(args.scheme)
+            return
+
         scheme = scheme_class.find(args.interface, args.scheme)
         assert scheme, "Couldn't find a scheme named {0!r}, did you mean to use -a?".format(args.scheme)
 
+    history = open_history(args)
     try:
-        scheme.activate()
+        if history:
+            history.activate(scheme, cell or history_cell(args, scheme))
+        else:
+            scheme.activate()
     except ConnectionError:
         assert False, "Failed to connect to %s." % scheme.name
+    finally:
+        if history:
+            history.close()
+
+
+def report_attempts(attempts):
+    for attempt in attempts:
+        if attempt.succeeded:
+            sys.stderr.write('Connected to "%s" in %.1fs.\n' % (attempt.scheme.ssid, attempt.duration))
+        else:
+            sys.stderr.write('Failed to connect to "%s" after %.1fs: %s\n' % (
+                attempt.scheme.ssid, attempt.duration, attempt.error))
 
 
 def autoconnect_command(args):
-    ssids = [cell.ssid for cell in Cell.all(args.interface)]
-
-    for scheme in Scheme.all():
-        # TODO: make it easier to get the SSID off of a scheme.
-        ssid = scheme.options.get('wpa-ssid', scheme.options.get('wireless-essid'))
-        if ssid in ssids:
-            sys.stderr.write('Connecting to "%s".\n' % ssid)
-            try:
-                scheme.activate()
-            except ConnectionError:
-                assert False, "Failed to connect to %s." % scheme.name
-            break
-    else:
-        assert False, "Couldn't find any schemes that are currently available."
+    client = daemon_client(args)
+    if client:
+        ip_address, attempts = client.autoconnect(args.timeout, args.attempt_timeout, args.wpa_supplicant)
+        report_attempts(attempts)
+        assert ip_address, "Failed to connect to any of the available schemes."
+        return
+
+    pairs = rank_available(Scheme.for_file(args.file).all(), list(scan_cells(args)))
+    assert pairs, "Couldn't find any schemes that are currently available."
+    cells = dict((scheme.iface, cell) for scheme, cell in pairs)
+    candidates = [scheme for scheme, cell in pairs]
+
+    history = open_history(args)
+    try:
+        if history:
+            candidates = history.rank(candidates)
+
+        connection, attempts = activate_first(candidates, args.timeout, args.attempt_timeout)
+
+        if history:
+            for attempt in attempts:
+                history.record(attempt, cells[attempt.scheme.iface])
+    finally:
+        if history:
+            history.close()
+    report_attempts(attempts)
+
+    assert connection, "Failed to connect to any of the available schemes."
+    return connection
+
+
+def daemon_command(args):
+    from wifi.daemon import serve
+    if args.metrics_port:
+        metrics.registry.serve(args.metrics_port)
+    serve(args.socket, args.max_age)
 
 
 def arg_parser():
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-i',
                         '--interface',
@@ -119,12 +317,64 @@ def arg_parser():
                         '--file',
                         default='/etc/network/interfaces',
                         help="Specifies which file for scheme storage.")
+    parser.add_argument('--history',
+                        metavar='FILE',
+                        help="Records connection attempts in this database and"
+                             " prefers schemes that historically connect fastest.")
+    parser.add_argument('--socket',
+                        default=os.environ.get('WIFI_SOCKET', '/var/run/wifi.sock'),
+                        help="The Unix socket of the wifi daemon.  Commands are sent to the"
+                             " daemon when it is running.")
+    parser.add_argument('--metrics-textfile',
+                        metavar='FILE',
+                        help="Writes metrics about the command to this file in the Prometheus"
+                             " text format, for node_exporter's textfile collector.")
+    parser.add_argument('--wpa-supplicant',
+                        nargs='?',
+                        const='/var/run/wpa_supplicant',
+                        metavar='CTRL_DIR',
+                        help="Gets the scan results from wpa_supplicant's control interface"
+                             " instead of running iwlist.")
+    parser.add_argument('--trace',
+                        action='store_true',
+                        help="Prints how much time was spent in each external command.")
 
     subparsers = parser.add_subparsers(title='commands')
 
     parser_scan = subparsers.add_parser('scan', help="Shows a list of available networks.")
+    parser_scan.add_argument('--format',
+                             choices=['table', 'json', 'ndjson', 'csv'],
+                             default='table',
+                             help="The output format.  ndjson and csv print each network as"
+                                  " soon as it is parsed.")
+    parser_scan.add_argument('--fields',
+                             type=fields,
+                             help="Comma separated list of the fields to show: {0}."
+                                  "  Defaults to {1}.".format(', '.join(sorted(scan_fields)),
+                                                              ','.join(default_scan_fields)))
+    parser_scan.add_argument('--channels',
+                             type=channel_list,
+                             help="Comma separated list of the channels to scan, e.g. 1,6,11.")
+    parser_scan.add_argument('--band',
+                             choices=['2.4', '5'],
+                             help="Only scans the 2.4 or 5 GHz band.")
+    parser_scan.add_argument('--cached',
+                             action='store_true',
+                             help="Shows the results of the driver's last scan instead of scanning,"
+                                  " unless they are missing or stale.")
     parser_scan.set_defaults(func=scan_command)
 
+    parser_channels = subparsers.add_parser('channels',
+                                            help="Shows how congested each channel is.")
+    parser_channels.add_argument('--band',
+                                 choices=['2.4', '5'],
+                                 default='2.4',
+                                 help="The band to analyze, in GHz.")
+    parser_channels.add_argument('--recommend',
+                                 action='store_true',
+                                 help="Only prints the least congested channel.")
+    parser_channels.set_defaults(func=channels_command)
+
     parser_list = subparsers.add_parser('list', help="Shows a list of networks already configured.")
     parser_list.set_defaults(func=list_command)
 
@@ -157,44 +407,59 @@ def arg_parser():
                                 help="Connect to a network without storing it in the config file")
     parser_connect.set_defaults(func=connect_command)
 
-    # TODO: how to specify the correct interfaces file to work off of.
-    parser_connect.get_options = lambda: [scheme.name for scheme in Scheme.all()]
-
     parser_autoconnect = subparsers.add_parser(
         'autoconnect',
         help="Searches for saved schemes that are currently"
              " available and connects to the first one it finds."
     )
+    parser_autoconnect.add_argument('-t',
+                                    '--timeout',
+                                    type=float,
+                                    help="Total number of seconds to spend trying the available schemes.")
+    parser_autoconnect.add_argument('--attempt-timeout',
+                                    type=float,
+                                    help="Number of seconds to spend on each scheme before moving on.")
     parser_autoconnect.set_defaults(func=autoconnect_command)
 
-    return parser, subparsers
-
-
-def autocomplete(position, wordlist, subparsers):
-    if position == 1:
-        ret = subparsers.choices.keys()
-    else:
-        try:
-            prev = wordlist[position - 1]
-            ret = subparsers.choices[prev].get_options()
-        except (IndexError, KeyError, AttributeError):
-            ret = []
+    parser_daemon = subparsers.add_parser(
+        'daemon',
+        help="Keeps scan results and schemes in memory and serves the other"
+             " commands over a Unix socket."
+    )
+    parser_daemon.add_argument('--max-age',
+                               type=float,
+                               default=30,
+                               help="Number of seconds for which a scan is reused.")
+    parser_daemon.add_argument('--metrics-port',
+                               type=int,
+                               help="Serves metrics in the Prometheus text format on this local port.")
+    parser_daemon.set_defaults(func=daemon_command)
 
-    print(' '.join(ret))
+    return parser, subparsers
 
 
 def main():
+    if 'WIFI_AUTOCOMPLETE' in os.environ:
+        # This runs on every TAB press, so it doesn't build the parser.
+        print_completion()
+        return
+
     parser, subparsers = arg_parser()
     argv = sys.argv[1:]
     args = parser.parse_args(argv)
 
+    collector = TraceCollector()
+    if args.trace:
+        add_hook(collector)
+
     try:
-        if 'WIFI_AUTOCOMPLETE' in os.environ:
-            autocomplete(int(os.environ['COMP_CWORD']),
-                         os.environ['COMP_WORDS'].split(), subparsers)
-        else:
-            command = getattr(args, 'func', scan_command)
-            command(args)
-    except (AssertionError, InterfaceError) as e:
+        command = getattr(args, 'func', scan_command)
+        command(args)
+    except (AssertionError, DaemonError, InterfaceError) as e:
         sys.stderr.write("Error: ")
         sys.exit(e)
+    finally:
+        if args.trace:
+            collector.print_summary()
+        if args.metrics_textfile:
+            metrics.registry.write_textfile(args.metrics_textfile)
@@ -0,0 +1,119 @@
+"""
+Shell completion that answers without building the argument parser or
+parsing the interfaces file.
+
+Scheme names are read from a small index that lives next to the interfaces
+file and that :meth:`Scheme.save <wifi.Scheme.save>` and
+:meth:`Scheme.delete <wifi.Scheme.delete>` keep up to date.  The index
+records the stat signature of the interfaces file, so an index that is out
+of date because the file was edited by hand is ignored and rebuilt.
+
+Besides the name, the index has the byte range of each scheme's stanza,
+which :meth:`Scheme.find <wifi.Scheme.find>` and :meth:`Scheme.delete
+<wifi.Scheme.delete>` use to go straight to it.
+"""
+import os
+import sys
+
+
+DEFAULT_INTERFACES = '/etc/network/interfaces'
+
+COMMANDS = ['scan', 'channels', 'list', 'config', 'add', 'connect', 'autoconnect', 'daemon']
+
+
+def index_path(interfaces):
+    directory, name = os.path.split(interfaces)
+    return os.path.join(directory, '.{0}.wifi-index'.format(name))
+
+
+def signature(interfaces):
+    stat = os.stat(interfaces)
+    return '{0} {1} {2}'.format(stat.st_ino, stat.st_size, getattr(stat, 'st_mtime_ns', repr(stat.st_mtime)))
+
+
+def write_index(interfaces, entries):
+    """
+    Writes the index of `interfaces` from a list of ``(interface, name,
+    start, end)`` tuples.  It has to be called while the interfaces file
+    is locked, so that the signature matches the entries.
+    """
+    # tempfile is slow to import, and completion only reads the index.
+    import tempfile
+
+    path = index_path(interfaces)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(signature(interfaces) + '\n')
+            for interface, name, start, end in entries:
+                f.write('{0} {1} {2} {3}\n'.format(start, end, interface, name))
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_index(interfaces):
+    """
+    Returns a list of ``(interface, name, start, end)`` tuples, or `None`
+    if the index is missing or out of date.
+    """
+    try:
+        with open(index_path(interfaces)) as f:
+            if f.readline().rstrip('\n') != signature(interfaces):
+                return None
+            entries = []
+            for line in f.read().splitlines():
+                start, end, interface, name = line.split(' ', 3)
+                entries.append((interface, name, int(start), int(end)))
+            return entries
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def scheme_names(interfaces):
+    entries = read_index(interfaces)
+    if entries is None:
+        from wifi.scheme import Scheme
+        try:
+            entries = Scheme.for_file(interfaces).refresh_index()
+        except (IOError, OSError):
+            return []
+
+    return [name for interface, name, start, end in entries]
+
+
+def find_interfaces(words):
+    for i, word in enumerate(words):
+        if word in ('-f', '--file') and i + 1 < len(words):
+            return words[i + 1]
+        elif word.startswith('--file='):
+            return word.split('=', 1)[1]
+    return DEFAULT_INTERFACES
+
+
+def complete(position, words):
+    """
+    Returns the candidates for the word at `position` of `words`.
+    """
+    if not any(word in COMMANDS for word in words[1:position]):
+        return COMMANDS
+
+    try:
+        prev = words[position - 1]
+    except IndexError:
+        return []
+
+    if prev == 'connect':
+        return scheme_names(find_interfaces(words))
+    return []
+
+
+def print_completion():
+    """
+    Prints the candidates for the word at ``COMP_CWORD`` of ``COMP_WORDS``,
+    the way the bash completion script asks for them.
+    """
+    words = os.environ['COMP_WORDS'].split()
+    sys.stdout.write(' '.join(complete(int(os.environ['COMP_CWORD']), words)) + '\n')
@@ -0,0 +1,113 @@
+"""
+Coordinates activations so that they never overlap on one interface.
+
+Running ifdown and ifup for two schemes of the same interface at the same
+time leaves it in an undefined state, while different interfaces can come
+up in parallel.  :class:`Coordinator` holds a lock for each interface,
+both within the process and, through a lock file, across processes.
+"""
+import threading
+from contextlib import contextmanager
+import os
+
+from wifi.locking import FileLock, acquire
+from wifi.scheme import Attempt, remaining
+from wifi.exceptions import InterfaceBusyError
+from wifi.utils import monotonic
+
+
+DEFAULT_LOCK_DIR = '/var/lock/wifi'
+
+
+class Coordinator(object):
+    """
+    Activates schemes one at a time per interface.  The lock files live in
+    `lock_dir`.  When an interface is busy, an activation waits for it if
+    `wait` is true (for no longer than its timeout) and otherwise raises
+    :class:`~wifi.exceptions.InterfaceBusyError` straight away.
+    """
+
+    def __init__(self, lock_dir=DEFAULT_LOCK_DIR, wait=True):
+        self.lock_dir = lock_dir
+        self.wait = wait
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def thread_lock(self, interface):
+        with self.lock:
+            if interface not in self.locks:
+                self.locks[interface] = threading.Lock()
+            return self.locks[interface]
+
+    @contextmanager
+    def hold(self, interface, timeout=None):
+        """
+        Holds the lock of `interface` for the duration of a ``with``
+        block.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+
+        # The thread lock keeps the threads of this process from polling
+        # the lock file against each other.
+        thread_lock = self.thread_lock(interface)
+        if not acquire(thread_lock.acquire, self.wait, remaining(deadline)):
+            raise InterfaceBusyError("{0} is busy".format(interface))
+        try:
+            file_lock = FileLock(os.path.join(self.lock_dir, interface + '.lock'))
+            if not file_lock.acquire(self.wait, remaining(deadline)):
+                raise InterfaceBusyError("{0} is busy in another process".format(interface))
+            try:
+                yield
+            finally:
+                file_lock.release()
+        finally:
+            thread_lock.release()
+
+    def activate(self, scheme, timeout=None):
+        """
+        Activates `scheme` once its interface is free.  `timeout` covers
+        the wait as well as the activation.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.hold(scheme.interface, timeout):
+            return scheme.activate(remaining(deadline))
+
+    def activate_all(self, schemes, timeout=None):
+        """
+        Activates every one of `schemes`, those of different interfaces in
+        parallel and those of the same interface in turn, all within
+        `timeout` seconds.
+
+        Returns a tuple of the list of :class:`~wifi.scheme.Connection`
+        objects, in the order of `schemes` and with `None` for the schemes
+        that failed, and the list of :class:`~wifi.scheme.Attempt`
+        objects.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        connections = [None] * len(schemes)
+        attempts = [None] * len(schemes)
+
+        def run(indexes):
+            for i in indexes:
+                start = monotonic()
+                try:
+                    connections[i] = self.activate(schemes[i], remaining(deadline))
+                except Exception as e:
+                    # Anything left uncaught would end the thread silently and
+                    # skip the other schemes of the interface.
+                    attempts[i] = Attempt(schemes[i], monotonic() - start, e)
+                else:
+                    attempts[i] = Attempt(schemes[i], monotonic() - start,
+                                          timings=connections[i].timings)
+
+        by_interface = {}
+        for i, scheme in enumerate(schemes):
+            by_interface.setdefault(scheme.interface, []).append(i)
+
+        threads = [threading.Thread(target=run, args=(indexes,)) for indexes in by_interface.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return connections, attempts
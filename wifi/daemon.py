@@ -0,0 +1,276 @@
+"""
+A long running process that keeps scan results and parsed schemes warm and
+serves them over a Unix socket.
+
+The protocol is one JSON object per line in each direction.  A request
+looks like ``{"command": "scan", "interface": "wlan0", "file":
+"/etc/network/interfaces"}`` and the response is either ``{"result":
+...}`` or ``{"error": "message"}``.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+from wifi.scan import Cell, encode_ssid
+from wifi.scheme import Attempt, Scheme, activate_first, rank_available
+from wifi.exceptions import ConnectionError, DaemonError, InterfaceError
+from wifi.utils import ensure_file_exists, monotonic
+import wifi.subprocess_compat as subprocess
+
+
+DEFAULT_SOCKET = '/var/run/wifi.sock'
+
+
+def cell_to_dict(cell):
+    # The SSID can be turned back into its bytes, which JSON can't carry.
+    d = dict(vars(cell))
+    del d['ssid_bytes']
+    return d
+
+
+def cell_from_dict(d):
+    cell = Cell()
+    cell.__dict__.update(d)
+    if cell.ssid is not None:
+        cell.ssid_bytes = encode_ssid(cell.ssid)
+    return cell
+
+
+def scheme_to_dict(scheme):
+    return {'interface': scheme.interface, 'name': scheme.name, 'options': scheme.options}
+
+
+def scheme_from_dict(d):
+    return Scheme(d['interface'], d['name'], d['options'])
+
+
+def attempt_to_dict(attempt):
+    return {
+        'scheme': scheme_to_dict(attempt.scheme),
+        'duration': attempt.duration,
+        'error': None if attempt.succeeded else str(attempt.error),
+        'timings': attempt.timings,
+    }
+
+
+def attempt_from_dict(d):
+    return Attempt(scheme_from_dict(d['scheme']), d['duration'], d['error'], d['timings'])
+
+
+class Daemon(object):
+    """
+    The state shared by all of the daemon's connections.
+
+    Scans are reused for `max_age` seconds and schemes are only parsed
+    again when their interfaces file changes.  Everything that touches the
+    radio holds :attr:`radio`, so scans and activations never overlap.
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self.radio = threading.Lock()
+        self.scans = {}
+        self.schemes = {}
+        self.schemes_lock = threading.Lock()
+
+    def scan(self, interface, fresh=False, ctrl_dir=None, last=False):
+        with self.radio:
+            return self._scan(interface, fresh, ctrl_dir, last)
+
+    def _scan(self, interface, fresh=False, ctrl_dir=None, last=False):
+        """
+        Scans with wpa_supplicant's control interface in `ctrl_dir`, if it
+        is given, or with iwlist.  With `last`, the results of the last
+        scan are used when nothing is cached.  Those results may be old, so
+        they aren't cached for later requests.
+        """
+        key = (interface, ctrl_dir)
+        cached = self.scans.get(key)
+        if not fresh and cached and monotonic() - cached[0] < self.max_age:
+            return cached[1]
+
+        if ctrl_dir:
+            from wifi import wpa_supplicant
+            cells = wpa_supplicant.scan(interface, ctrl_dir, fresh=not last)
+        else:
+            cells = list(Cell.all(interface, fresh=not last))
+        if not last:
+            self.scans[key] = (monotonic(), cells)
+        return cells
+
+    def all(self, interfaces):
+        with self.schemes_lock:
+            ensure_file_exists(interfaces)
+            stat = os.stat(interfaces)
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime)
+
+            cached = self.schemes.get(interfaces)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+            schemes = list(Scheme.for_file(interfaces).all())
+            self.schemes[interfaces] = (signature, schemes)
+            return schemes
+
+    def connect(self, interfaces, interface, name):
+        for scheme in self.all(interfaces):
+            if scheme.interface == interface and scheme.name == name:
+                break
+        else:
+            raise DaemonError("Couldn't find a scheme named {0!r}, did you mean to use -a?".format(name))
+
+        with self.radio:
+            return scheme.activate()
+
+    def autoconnect(self, interfaces, interface, timeout=None, attempt_timeout=None, ctrl_dir=None):
+        schemes = self.all(interfaces)
+        with self.radio:
+            pairs = rank_available(schemes, self._scan(interface, ctrl_dir=ctrl_dir))
+            if not pairs:
+                raise DaemonError("Couldn't find any schemes that are currently available.")
+            return activate_first([scheme for scheme, cell in pairs], timeout, attempt_timeout)
+
+    def handle(self, request):
+        """
+        Runs one request and returns the JSON-serializable result.
+        """
+        command = request.get('command')
+        interface = request.get('interface', 'wlan0')
+        interfaces = request.get('file', Scheme.interfaces)
+
+        if command == 'scan':
+            cells = self.scan(interface, request.get('fresh', False), request.get('wpa_supplicant'),
+                              request.get('last', False))
+            return [cell_to_dict(cell) for cell in cells]
+        elif command == 'list':
+            return [scheme_to_dict(scheme) for scheme in self.all(interfaces)]
+        elif command == 'connect':
+            connection = self.connect(interfaces, interface, request['scheme'])
+            return {'ip_address': connection.ip_address}
+        elif command == 'autoconnect':
+            connection, attempts = self.autoconnect(interfaces, interface,
+                                                    request.get('timeout'),
+                                                    request.get('attempt_timeout'),
+                                                    request.get('wpa_supplicant'))
+            return {
+                'ip_address': connection and connection.ip_address,
+                'attempts': [attempt_to_dict(attempt) for attempt in attempts],
+            }
+        else:
+            raise DaemonError("Unknown command {0!r}".format(command))
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {'result': self.server.daemon.handle(json.loads(line.decode('utf-8')))}
+            except (ValueError, KeyError) as e:
+                response = {'error': "Bad request: {0}".format(e)}
+            except (DaemonError, ConnectionError, InterfaceError, EnvironmentError,
+                    subprocess.CalledProcessError) as e:
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        # A socket left behind by a daemon that died would make bind fail.
+        if os.path.exists(path):
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+    def server_bind(self):
+        # Anyone who can talk to the daemon can change the network, so the
+        # socket is private from the moment it is created.
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(path=DEFAULT_SOCKET, max_age=30):
+    server = Server(path, Daemon(max_age))
+    # Clean up the socket when asked to stop by an init system.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class Client(object):
+    """
+    Talks to a running daemon.  Raises :class:`socket.error` when there
+    is no daemon listening on `path`.
+    """
+
+    def __init__(self, path, interface, interfaces):
+        self.interface = interface
+        self.interfaces = interfaces
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(path)
+        except socket.error:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile('rwb')
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def request(self, command, **params):
+        params.update(command=command, interface=self.interface, file=self.interfaces)
+        self.file.write(json.dumps(params).encode('utf-8') + b'\n')
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise DaemonError("The wifi daemon closed the connection.")
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response['result']
+
+    def scan(self, fresh=False, ctrl_dir=None, last=False):
+        """
+        Returns the cells on the interface.  `ctrl_dir` is the directory of
+        wpa_supplicant's control sockets, to scan through it instead of
+        running iwlist, and `last` reads the driver's last results.
+        """
+        cells = self.request('scan', fresh=fresh, wpa_supplicant=ctrl_dir, last=last)
+        return [cell_from_dict(d) for d in cells]
+
+    def all(self):
+        return [scheme_from_dict(d) for d in self.request('list')]
+
+    def connect(self, name):
+        return self.request('connect', scheme=name)['ip_address']
+
+    def autoconnect(self, timeout=None, attempt_timeout=None, ctrl_dir=None):
+        """
+        Returns the IP address (or `None`) and the list of
+        :class:`~wifi.scheme.Attempt` objects that were made.
+        """
+        result = self.request('autoconnect', timeout=timeout, attempt_timeout=attempt_timeout,
+                              wpa_supplicant=ctrl_dir)
+        return result['ip_address'], [attempt_from_dict(d) for d in result['attempts']]
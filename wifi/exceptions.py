@@ -4,3 +4,11 @@ class ConnectionError(Exception):
 
 class InterfaceError(Exception):
     pass
+
+
+class DaemonError(Exception):
+    pass
+
+
+class InterfaceBusyError(ConnectionError):
+    pass
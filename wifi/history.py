@@ -0,0 +1,137 @@
+"""
+A local record of how activating each scheme went in the past, so that
+network selection can prefer the networks that connect quickly and
+reliably.
+"""
+import sqlite3
+import time
+
+from wifi.scheme import Attempt
+from wifi.exceptions import ConnectionError
+from wifi.utils import monotonic
+import wifi.subprocess_compat as subprocess
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    interface TEXT NOT NULL,
+    scheme TEXT NOT NULL,
+    ssid TEXT,
+    bssid TEXT,
+    signal INTEGER,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    ifdown REAL,
+    ifup REAL,
+    succeeded INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_duration
+    ON attempts (interface, scheme, succeeded, duration);
+CREATE INDEX IF NOT EXISTS attempts_by_start
+    ON attempts (interface, scheme, succeeded, started);
+"""
+
+
+class History(object):
+    """
+    Connection outcomes stored in an SQLite database at `path`.  Use it as
+    a context manager to close the database at the end of a block.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, attempt, cell=None):
+        """
+        Stores an :class:`~wifi.scheme.Attempt`.  `cell` is the
+        :class:`~wifi.Cell` that was being connected to, if known.
+        """
+        scheme = attempt.scheme
+        with self.db:
+            self.db.execute(
+                'INSERT INTO attempts (interface, scheme, ssid, bssid, signal, started,'
+                ' duration, ifdown, ifup, succeeded) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (scheme.interface, scheme.name, scheme.ssid,
+                 cell and cell.address, cell and cell.signal,
+                 time.time() - attempt.duration, attempt.duration,
+                 attempt.timings.get('ifdown'), attempt.timings.get('ifup'),
+                 attempt.succeeded))
+
+    def activate(self, scheme, cell=None, timeout=None):
+        """
+        Activates `scheme` like :meth:`Scheme.activate
+        <wifi.Scheme.activate>` does, recording the outcome.
+        """
+        start = monotonic()
+        try:
+            connection = scheme.activate(timeout=timeout)
+        except (ConnectionError, subprocess.CalledProcessError) as e:
+            self.record(Attempt(scheme, monotonic() - start, e), cell)
+            raise
+        self.record(Attempt(scheme, monotonic() - start, timings=connection.timings), cell)
+        return connection
+
+    def _where(self, scheme):
+        return 'WHERE interface = ? AND scheme = ?', (scheme.interface, scheme.name)
+
+    def success_rate(self, scheme):
+        """
+        Returns the fraction of attempts to activate `scheme` that
+        succeeded, or `None` if it has never been tried.
+        """
+        where, params = self._where(scheme)
+        total, succeeded = self.db.execute(
+            'SELECT COUNT(*), SUM(succeeded) FROM attempts ' + where, params).fetchone()
+        if not total:
+            return None
+        return succeeded / float(total)
+
+    def median_time_to_ip(self, scheme):
+        """
+        Returns the median number of seconds a successful activation of
+        `scheme` took, or `None` if it has never succeeded.
+        """
+        where, params = self._where(scheme)
+        where += ' AND succeeded = 1'
+        count = self.db.execute('SELECT COUNT(*) FROM attempts ' + where, params).fetchone()[0]
+        if not count:
+            return None
+
+        # Only the one or two middle rows are read, walking the index.
+        middle = self.db.execute(
+            'SELECT duration FROM attempts ' + where + ' ORDER BY duration LIMIT ? OFFSET ?',
+            params + (2 - count % 2, (count - 1) // 2)).fetchall()
+        return sum(row[0] for row in middle) / len(middle)
+
+    def last_good_bssid(self, scheme):
+        """
+        Returns the BSSID of the most recent successful activation of
+        `scheme`, or `None`.
+        """
+        where, params = self._where(scheme)
+        row = self.db.execute(
+            'SELECT bssid FROM attempts ' + where + ' AND succeeded = 1'
+            ' ORDER BY started DESC LIMIT 1', params).fetchone()
+        return row and row[0]
+
+    def rank(self, schemes):
+        """
+        Sorts `schemes` so that the ones that historically connect fastest
+        come first.  Schemes that have never connected keep their relative
+        order at the end.
+        """
+        schemes = list(schemes)
+        medians = dict((id(scheme), self.median_time_to_ip(scheme)) for scheme in schemes)
+        return sorted(schemes, key=lambda scheme: (medians[id(scheme)] is None, medians[id(scheme)] or 0))
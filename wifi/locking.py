@@ -0,0 +1,99 @@
+"""
+Locks that hold across processes, built on flock(2).
+"""
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+from wifi.utils import monotonic
+
+
+POLL_INTERVAL = 0.05
+
+
+def acquire(try_acquire, blocking=True, timeout=None):
+    """
+    Calls `try_acquire`, which takes a `blocking` flag and returns whether
+    it got the lock, until it succeeds.  With a `timeout`, gives up and
+    returns `False` after that many seconds.
+    """
+    if not blocking or timeout is None:
+        return try_acquire(blocking)
+
+    deadline = monotonic() + timeout
+    while not try_acquire(False):
+        left = deadline - monotonic()
+        if left <= 0:
+            return False
+        time.sleep(min(POLL_INTERVAL, left))
+    return True
+
+
+@contextmanager
+def locked_file(path, mode='r', exclusive=False):
+    """
+    Opens the file at `path` with `mode` and holds a shared lock on it, or
+    an exclusive one, until the ``with`` block ends.  The file is
+    positioned at its start.
+    """
+    with open(path, mode) as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        f.seek(0)
+        yield f
+
+
+class FileLock(object):
+    """
+    A shared or exclusive lock on the file at `path`, which is created if
+    needed.  Can be used as a context manager, which waits for the lock.
+
+    Like any flock, it also excludes other threads of the same process
+    that lock the same file through a :class:`FileLock` of their own.
+    """
+
+    def __init__(self, path, exclusive=True):
+        self.path = path
+        self.exclusive = exclusive
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def try_acquire(self, blocking):
+        operation = fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.file.fileno(), operation)
+        except (IOError, OSError):
+            if blocking:
+                raise
+            return False
+        return True
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Returns whether the lock was acquired; it always is when
+        `blocking` without a `timeout`.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.file = open(self.path, 'a')
+
+        if acquire(self.try_acquire, blocking, timeout):
+            return True
+        self.file.close()
+        self.file = None
+        return False
+
+    def release(self):
+        if self.file is not None:
+            # Closing the file releases the lock.
+            self.file.close()
+            self.file = None
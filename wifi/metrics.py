@@ -0,0 +1,172 @@
+"""
+Counters and histograms for scans and activations, exported in the
+Prometheus text format.
+
+The metrics are created once when this module is imported and recording a
+value only touches preallocated state, so instrumenting the scan and
+connect paths costs next to nothing.
+"""
+from __future__ import division
+
+import bisect
+import os
+
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+CELL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def format_labels(labels, extra=None):
+    pairs = sorted(labels.items())
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, v) for k, v in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, format_labels(self.labels), self.value
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.bounds = list(buckets)
+        # One slot per bucket plus the +Inf bucket.  The counts are not
+        # cumulative until they are exported.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.bounds + [float('inf')], self.counts):
+            cumulative += count
+            yield (self.name + '_bucket',
+                   format_labels(self.labels, ('le', format_value(bound))),
+                   cumulative)
+        yield self.name + '_sum', format_labels(self.labels), self.sum
+        yield self.name + '_count', format_labels(self.labels), cumulative
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Returns all of the metrics in the Prometheus text format.
+        """
+        lines = []
+        seen = set()
+        for metric in self.metrics:
+            # Metrics that only differ by their labels share a header.
+            if metric.name not in seen:
+                seen.add(metric.name)
+                lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+                lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append('{0}{1} {2}'.format(name, labels, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        Writes the metrics to `path` for node_exporter's textfile
+        collector.  The file is replaced atomically so that the collector
+        never reads half of it.
+        """
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.rename(path + '.tmp', path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves the metrics over HTTP from a background thread and returns
+        the server.
+        """
+        # Only imported here, it would slow down every import of wifi.
+        import threading
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+        except ImportError:  # Python 2
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+registry = Registry()
+
+scan_seconds = registry.histogram(
+    'wifi_scan_seconds', 'Time spent waiting for iwlist.', labels={'source': 'scan'})
+last_scan_seconds = registry.histogram(
+    'wifi_scan_seconds', 'Time spent waiting for iwlist.', labels={'source': 'last'})
+parse_seconds = registry.histogram(
+    'wifi_scan_parse_seconds', 'Time spent parsing the output of iwlist scan.')
+scan_cells = registry.histogram(
+    'wifi_scan_cells', 'Number of cells found by each scan.', CELL_BUCKETS)
+interface_errors = registry.counter(
+    'wifi_interface_errors_total', 'Number of scans that raised an InterfaceError.')
+activation_seconds = registry.histogram(
+    'wifi_activation_seconds', 'Time spent activating schemes.')
+activation_successes = registry.counter(
+    'wifi_activations_total', 'Number of scheme activations.', {'outcome': 'success'})
+activation_failures = registry.counter(
+    'wifi_activations_total', 'Number of scheme activations.', {'outcome': 'failure'})
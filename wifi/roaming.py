@@ -0,0 +1,110 @@
+"""
+Keeps a connection on the strongest access point of its network.
+"""
+import time
+
+from wifi.scan import Cell
+from wifi.exceptions import ConnectionError, InterfaceError
+from wifi.utils import monotonic
+
+
+def reassociate(scheme, cell):
+    """
+    Moves the connection of `scheme` to the access point of `cell`.
+    """
+    return scheme.roam(cell.address)
+
+
+class RoamingMonitor(object):
+    """
+    Watches the signal of the access point that `scheme` is connected to
+    (`bssid`) and moves to another access point of the same network when
+    the link gets weak.
+
+    A roam happens when the current signal is below `threshold` dBm and
+    another access point beats it by at least `margin` dB for `samples`
+    scans in a row.  Roams are never closer together than `min_interval`
+    seconds.  If a :class:`~wifi.tracking.CellTracker` is given as
+    `tracker`, its smoothed signals are compared instead of the raw ones.
+    """
+
+    def __init__(self, scheme, bssid, threshold=-70, margin=8, samples=3, min_interval=60,
+                 reassociate=reassociate, clock=monotonic, tracker=None):
+        self.scheme = scheme
+        self.bssid = bssid
+        self.threshold = threshold
+        self.margin = margin
+        self.samples = samples
+        self.min_interval = min_interval
+        self.reassociate = reassociate
+        self.clock = clock
+        self.tracker = tracker
+
+        self.signal = None
+        self.streak = 0
+        self.last_roam = None
+
+    def update(self, cells):
+        """
+        Takes the cells of one scan into account and returns the
+        :class:`Cell` to roam to, or `None`.
+        """
+        signal = lambda cell: cell.signal
+        if self.tracker:
+            cells = list(cells)
+            self.tracker.update(cells)
+            signal = self.tracker.signal
+
+        current = None
+        candidate = None
+        for cell in cells:
+            if cell.ssid != self.scheme.ssid or cell.signal is None:
+                continue
+            if cell.address == self.bssid:
+                current = cell
+            elif candidate is None or signal(cell) > signal(candidate):
+                candidate = cell
+
+        # An access point that has gone out of range counts as the weakest.
+        self.signal = signal(current) if current else -100
+
+        if (candidate and self.signal < self.threshold
+                and signal(candidate) - self.signal >= self.margin):
+            self.streak += 1
+        else:
+            self.streak = 0
+
+        if self.streak < self.samples:
+            return None
+        if self.last_roam is not None and self.clock() - self.last_roam < self.min_interval:
+            return None
+        return candidate
+
+    def roam(self, cell):
+        """
+        Reassociates with the access point of `cell`.
+        """
+        self.last_roam = self.clock()
+        self.streak = 0
+        connection = self.reassociate(self.scheme, cell)
+        self.bssid = cell.address
+        return connection
+
+    def run(self, interval=5, stop=None):
+        """
+        Scans every `interval` seconds and roams when needed, until the
+        :class:`threading.Event` `stop` is set.  Failed scans and roams are
+        retried on the next round.
+        """
+        while not (stop and stop.is_set()):
+            try:
+                cell = self.update(Cell.all(self.scheme.interface))
+                if cell:
+                    self.roam(cell)
+            except (ConnectionError, InterfaceError):
+                pass
+
+            if stop:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
@@ -0,0 +1,195 @@
+"""
+Runs the external tools that wifi depends on.
+
+The paths of the tools can be configured, and besides running them for
+real, a runner can record their output to a fixture directory or replay a
+recording, so that the whole scan and connect flow can run on a machine
+without a radio.  The runner used by default is configured from the
+environment:
+
+``WIFI_IWLIST``, ``WIFI_IFUP``, ``WIFI_IFDOWN``
+    The paths of the tools.
+``WIFI_RECORD``
+    Records every command to this fixture directory.
+``WIFI_REPLAY``
+    Replays the commands recorded in this fixture directory.
+``WIFI_REPLAY_LATENCY``
+    Multiplies the recorded duration of each command by this factor and
+    waits that long when replaying (defaults to 0).
+"""
+import os
+import threading
+import time
+
+import wifi.subprocess_compat as subprocess
+from wifi.utils import monotonic
+
+
+DEFAULT_PATHS = {
+    'iwlist': '/sbin/iwlist',
+    'ifup': '/sbin/ifup',
+    'ifdown': '/sbin/ifdown',
+}
+
+
+class Runner(object):
+    """
+    Runs the tools with :func:`wifi.subprocess_compat.check_output`.
+    `paths` overrides the locations in :data:`DEFAULT_PATHS`.
+    """
+
+    def __init__(self, paths=None):
+        self.paths = dict(DEFAULT_PATHS, **(paths or {}))
+
+    def argv(self, tool, args):
+        return [self.paths.get(tool, tool)] + list(args)
+
+    def run(self, tool, args, timeout=None):
+        """
+        Runs `tool` with `args` and returns its output, including stderr.
+        Raises :class:`CalledProcessError` if it fails.
+        """
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        return subprocess.check_output(self.argv(tool, args), stderr=subprocess.STDOUT, **kwargs)
+
+
+# The modules needed for recording and replaying are imported where they
+# are used, so that the plain runner doesn't slow down importing wifi.
+
+
+def fixture_name(tool, args):
+    import hashlib
+    import json
+
+    digest = hashlib.sha1(json.dumps([tool] + list(args)).encode('utf-8')).hexdigest()
+    return '{0}-{1}.json'.format(tool, digest[:12])
+
+
+class RecordingRunner(Runner):
+    """
+    Runs the tools for real and appends each run to a fixture in
+    `directory`.
+    """
+
+    def __init__(self, directory, paths=None):
+        super(RecordingRunner, self).__init__(paths)
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def run(self, tool, args, timeout=None):
+        start = monotonic()
+        try:
+            output = super(RecordingRunner, self).run(tool, args, timeout)
+        except subprocess.CalledProcessError as e:
+            self.record(tool, args, e.output, e.returncode, monotonic() - start)
+            raise
+        self.record(tool, args, output, 0, monotonic() - start)
+        return output
+
+    def record(self, tool, args, output, returncode, duration):
+        import base64
+        import json
+
+        path = os.path.join(self.directory, fixture_name(tool, args))
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            try:
+                with open(path) as f:
+                    fixture = json.load(f)
+            except IOError:
+                fixture = {'tool': tool, 'args': list(args), 'runs': []}
+
+            fixture['runs'].append({
+                'output': base64.b64encode(output or b'').decode('ascii'),
+                'returncode': returncode,
+                'duration': duration,
+            })
+            with open(path, 'w') as f:
+                json.dump(fixture, f, indent=2)
+
+
+class ReplayRunner(Runner):
+    """
+    Serves the runs recorded in `directory` instead of running anything.
+    Repeated commands get the recorded runs in order, starting over after
+    the last one.  Each replay waits for the recorded duration multiplied
+    by `latency`.
+    """
+
+    def __init__(self, directory, latency=0, paths=None):
+        super(ReplayRunner, self).__init__(paths)
+        self.directory = directory
+        self.latency = latency
+        self.fixtures = {}
+        self.lock = threading.Lock()
+
+    def next_run(self, tool, args):
+        import json
+
+        name = fixture_name(tool, args)
+        with self.lock:
+            if name not in self.fixtures:
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        self.fixtures[name] = (json.load(f)['runs'], [0])
+                except IOError:
+                    raise OSError("No recording of {0} {1} in {2}".format(
+                        tool, ' '.join(args), self.directory))
+
+            runs, position = self.fixtures[name]
+            run = runs[position[0] % len(runs)]
+            position[0] += 1
+            return run
+
+    def run(self, tool, args, timeout=None):
+        import base64
+
+        argv = self.argv(tool, args)
+        run = self.next_run(tool, args)
+        output = base64.b64decode(run['output'])
+        delay = run['duration'] * self.latency
+
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            subprocess.report(argv, timeout, 0, None)
+            raise subprocess.TimeoutExpired(argv, timeout)
+        time.sleep(delay)
+
+        # Tracing hooks see replayed commands like real ones.
+        subprocess.report(argv, delay, len(output), run['returncode'])
+        if run['returncode']:
+            raise subprocess.CalledProcessError(run['returncode'], argv, output=output)
+        return output
+
+
+def from_environment(environ=os.environ):
+    paths = {}
+    for tool in DEFAULT_PATHS:
+        if 'WIFI_' + tool.upper() in environ:
+            paths[tool] = environ['WIFI_' + tool.upper()]
+
+    if environ.get('WIFI_REPLAY'):
+        return ReplayRunner(environ['WIFI_REPLAY'], float(environ.get('WIFI_REPLAY_LATENCY', 0)), paths)
+    elif environ.get('WIFI_RECORD'):
+        return RecordingRunner(environ['WIFI_RECORD'], paths)
+    return Runner(paths)
+
+
+runner = from_environment()
+
+
+def get_runner():
+    return runner
+
+
+def set_runner(new_runner):
+    """
+    Makes all of wifi run its commands with `new_runner`.
+    """
+    global runner
+    runner = new_runner
+
+
+def run(tool, args, timeout=None):
+    return runner.run(tool, args, timeout)
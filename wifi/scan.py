@@ -1,13 +1,27 @@
 from __future__ import division
 
+import binascii
+import codecs
 import re
 import textwrap
 
 import wifi.subprocess_compat as subprocess
-from wifi.utils import db2dbm
+from wifi import metrics, runner
+from wifi.utils import InternTable, db2dbm, monotonic
 from wifi.exceptions import InterfaceError
 
 
+# How old the driver's last scan can be, in seconds, before Cell.all(fresh=False)
+# scans anyway.
+LAST_SCAN_MAX_AGE = 30
+
+# The frequencies of each band, in MHz.
+BANDS = {
+    '2.4': (2400, 2500),
+    '5': (5000, 5900),
+}
+
+
 class Cell(object):
     """
     Presents a Python interface to the output of iwlist.
@@ -15,7 +29,10 @@ class Cell(object):
 
     def __init__(self):
         self.ssid = None
-        self.bitrates = []
+        # The SSID exactly as broadcast.  :attr:`ssid` is decoded from it
+        # as UTF-8, with any other bytes kept as surrogate escapes.
+        self.ssid_bytes = None
+        self.bitrates = ()
         self.address = None
         self.channel = None
         self.encrypted = False
@@ -26,24 +43,50 @@ class Cell(object):
         self.signal = None
         self.noise = None
 
+        # Numeric versions of frequency, quality and bitrates, parsed once so
+        # that sorting and filtering don't have to.
+        self.frequency_mhz = None
+        self.quality_ratio = None
+        self.bitrates_mbps = ()
+
     def __repr__(self):
         return 'Cell(ssid={ssid})'.format(**vars(self))
 
     @classmethod
-    def all(cls, interface):
+    def all(cls, interface, fresh=True, max_age=LAST_SCAN_MAX_AGE, channels=None, band=None):
         """
         Returns a list of all cells extracted from the output of iwlist.
+
+        Without `fresh`, the results of the driver's last scan are used
+        instead of scanning, which is quick and doesn't disturb the link.
+        A new scan is done anyway if the driver has no results or none of
+        the networks in them has been heard from in `max_age` seconds.
+
+        Only the cells on `channels` and in `band` (``'2.4'`` or ``'5'``
+        GHz) are returned, if they are given.
         """
-        try:
-            iwlist_scan = subprocess.check_output(['/sbin/iwlist', interface, 'scan'],
-                                                  stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            raise InterfaceError(e.output.strip())
-        else:
-            iwlist_scan = iwlist_scan.decode('utf-8')
-        cells = map(Cell.from_string, cells_re.split(iwlist_scan)[1:])
+        keep = block_filter(channels=channels, band=band)
+        return list(cls.iterate(interface, keep, fresh=fresh, max_age=max_age))
 
-        return cells
+    @classmethod
+    def iterate(cls, interface, block_filter=None, fresh=True, max_age=LAST_SCAN_MAX_AGE, essid=None):
+        """
+        Like :meth:`all`, but returns a generator that parses each cell only
+        when it is asked for, so the first cells are available right away.
+        Cells whose raw block doesn't pass `block_filter` are skipped
+        without being parsed.  With `essid`, the scan probes for that
+        network by name.
+
+        The output of iwlist is split up as bytes, and only the block of
+        each cell is decoded, when it's parsed.
+        """
+        try:
+            iwlist_scan = iwlist_output(interface, fresh, max_age, essid)
+        except InterfaceError:
+            metrics.interface_errors.inc()
+            raise
+        for cell in parse_cells(iwlist_scan, block_filter):
+            yield cell
 
     @classmethod
     def from_string(cls, cell_string):
@@ -54,21 +97,148 @@ class Cell(object):
         return normalize(cell_string)
 
     @classmethod
-    def where(cls, interface, fn):
+    def where(cls, interface, fn=None, **conditions):
         """
         Runs a filter over the output of :meth:`all` and the returns
         a list of cells that match that filter.
+
+        Besides the function `fn`, cells can be filtered on `ssid`,
+        `bssid`, `encrypted`, `min_signal` (in dBm), `channels` and `band`
+        (``'2.4'`` or ``'5'`` GHz).  Those conditions
+        are checked on the output of iwlist before a cell is parsed, so
+        cells that can't match are never fully parsed.
+        """
+        cells = cls.iterate(interface, block_filter(**conditions))
+        return list(filter(fn, cells) if fn else cells)
+
+    @classmethod
+    def probe(cls, interface, ssid):
+        """
+        Returns the cells of the network `ssid` found by probing for it by
+        name, which is quicker than listening for every network where
+        there are lots of them, and also finds networks that hide their
+        SSID.  Returns an empty list if the driver can't do that.
+        """
+        # Not finding it this way isn't an error, so it isn't counted as one.
+        try:
+            iwlist_scan = iwlist_output(interface, essid=ssid)
+        except InterfaceError:
+            return []
+        return list(parse_cells(iwlist_scan, block_filter(ssid=ssid)))
+
+    @classmethod
+    def find(cls, interface, ssid):
         """
-        return list(filter(fn, cls.all(interface)))
+        Returns the cell of the network `ssid` with the strongest signal,
+        or `None` if it isn't in range.  The network is looked for with
+        :meth:`probe` first, and all the networks are scanned if that
+        doesn't find it.
+        """
+        cell = strongest(cls.probe(interface, ssid))
+        if cell is None:
+            cell = strongest(cls.where(interface, ssid=ssid))
+        return cell
 
 
 cells_re = re.compile(r'Cell \d+ - ')
+cells_bytes_re = re.compile(br'Cell \d+ - ')
+last_beacon_re = re.compile(br'Last beacon: *(\d+)ms ago')
 quality_re_dict = {'dBm': re.compile(r'Quality[=:](?P<quality>\d+/\d+).*Signal level[=:](?P<siglevel>-\d+) dBm?(.*Noise level[=:](?P<noiselevel>-\d+) dBm)?'),
                    'relative': re.compile(r'Quality[=:](?P<quality>\d+/\d+).*Signal level[=:](?P<siglevel>\d+/\d+)'),
                    'absolute': re.compile(r'Quality[=:](?P<quality>\d+).*Signal level[=:](?P<siglevel>\d+)')}
 frequency_re = re.compile(r'^(?P<frequency>[\d\.]+ .Hz)(?:[\s\(]+Channel\s+(?P<channel>\d+)[\s\)]+)?$')
 
 
+def split_cells(iwlist_scan):
+    """
+    Yields the block of each cell in the output of iwlist scan, without
+    splitting the whole output up front.  Works on bytes as well as text.
+    """
+    pattern = cells_bytes_re if isinstance(iwlist_scan, bytes) else cells_re
+    start = None
+    for match in pattern.finditer(iwlist_scan):
+        if start is not None:
+            yield iwlist_scan[start:match.start()]
+        start = match.end()
+    if start is not None:
+        yield iwlist_scan[start:]
+
+
+def strongest(cells):
+    """
+    Returns the cell with the strongest signal, or `None` if there are no
+    cells.
+    """
+    if not cells:
+        return None
+    return max(cells, key=lambda cell: float('-inf') if cell.signal is None else cell.signal)
+
+
+def iwlist_output(interface, fresh=True, max_age=LAST_SCAN_MAX_AGE, essid=None):
+    """
+    Returns the output of iwlist for the cells of :meth:`Cell.iterate`.
+    """
+    iwlist_scan = None
+    if not fresh:
+        start = monotonic()
+        iwlist_scan = last_scan(interface, max_age)
+        metrics.last_scan_seconds.observe(monotonic() - start)
+    if iwlist_scan is None:
+        args = [interface, 'scan'] if essid is None else [interface, 'scanning', 'essid', essid]
+        start = monotonic()
+        try:
+            iwlist_scan = runner.run('iwlist', args)
+        except subprocess.CalledProcessError as e:
+            raise InterfaceError(e.output.strip())
+        except OSError as e:
+            raise InterfaceError("Couldn't run iwlist: {0}".format(e))
+        metrics.scan_seconds.observe(monotonic() - start)
+    return iwlist_scan
+
+
+def parse_cells(iwlist_scan, block_filter=None):
+    """
+    Yields the cells in the output of iwlist whose blocks pass
+    `block_filter`.
+    """
+    parse_seconds = 0
+    count = 0
+    try:
+        for cell_string in split_cells(iwlist_scan):
+            count += 1
+            parse_start = monotonic()
+            if block_filter and not block_filter(cell_string):
+                parse_seconds += monotonic() - parse_start
+                continue
+            cell = Cell.from_string(cell_string)
+            parse_seconds += monotonic() - parse_start
+            yield cell
+    finally:
+        metrics.parse_seconds.observe(parse_seconds)
+        metrics.scan_cells.observe(count)
+
+
+def last_scan(interface, max_age):
+    """
+    Returns the output of iwlist for the driver's last scan, or `None` if
+    it has none or the networks in it haven't been heard from in
+    `max_age` seconds.
+    """
+    try:
+        output = runner.run('iwlist', [interface, 'scanning', 'last'])
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    if not cells_bytes_re.search(output):
+        return None
+
+    # Drivers that say when they last heard each network let stale results
+    # be told apart.
+    ages = [int(age) for age in last_beacon_re.findall(output)]
+    if ages and min(ages) > max_age * 1000:
+        return None
+    return output
+
+
 identity = lambda x: x
 
 key_translations = {
@@ -99,34 +269,289 @@ def split_on_colon(string):
     return key, value
 
 
+unit_multipliers = {
+    'GHz': 1000,
+    'MHz': 1,
+    'kHz': 0.001,
+    'Gb/s': 1000,
+    'Mb/s': 1,
+    'kb/s': 0.001,
+}
+
+
+def parse_with_unit(string):
+    """
+    Converts strings like ``'2.437 GHz'`` or ``'5.5 Mb/s'`` to a number of
+    MHz or Mb/s.  Returns `None` if the string can't be parsed.
+    """
+    number, _, unit = string.strip().partition(' ')
+    try:
+        value = float(number) * unit_multipliers.get(unit.strip(), 1)
+    except ValueError:
+        return None
+    return int(value) if value == int(value) else value
+
+
+def frequency_to_mhz(frequency):
+    value = parse_with_unit(frequency)
+    # Frequencies are printed in GHz, so 2.437 GHz can come out as 2436.9999.
+    return None if value is None else int(round(value))
+
+
+bitrate_to_mbps = parse_with_unit
+
+
+def quality_to_ratio(quality):
+    actual, _, total = quality.partition('/')
+    try:
+        return int(actual) / int(total or 100)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def mhz_to_channel(mhz):
+    """
+    Returns the channel number of a frequency in the 2.4 or 5 GHz band.
+    """
+    if mhz == 2484:
+        return 14
+    elif 2412 <= mhz < 2484:
+        return (mhz - 2407) // 5
+    elif 5000 < mhz <= 5900:
+        return (mhz - 5000) // 5
+    return None
+
+
+def channel_to_mhz(channel):
+    """
+    Returns the frequency of a channel in the 2.4 or 5 GHz band, in MHz.
+    """
+    if channel == 14:
+        return 2484
+    elif 1 <= channel < 14:
+        return 2407 + channel * 5
+    elif 14 < channel <= 180:
+        return 5000 + channel * 5
+    return None
+
+
+def band_range(band):
+    """
+    Returns the lowest and highest frequency of `band`, in MHz.  `band`
+    can be given as ``'2.4'``, ``2.4``, ``'5'`` or ``5``.
+    """
+    try:
+        return BANDS['{0:g}'.format(float(band))]
+    except (KeyError, ValueError):
+        raise ValueError("Unknown band: {0}".format(band))
+
+
+def spectrum_filter(channels=None, band=None):
+    """
+    Returns a function that tells whether a frequency (in MHz) and channel
+    are on one of `channels` and in `band`, or `None` if neither is given.
+    """
+    if channels is None and band is None:
+        return None
+    channels = None if channels is None else set(channels)
+    low, high = (None, None) if band is None else band_range(band)
+
+    def allowed(mhz, channel):
+        if channels is not None and channel not in channels:
+            return False
+        return band is None or (mhz is not None and low <= mhz <= high)
+    return allowed
+
+
+def parse_quality(line):
+    """
+    Returns a tuple of the quality, the signal (in dBm) and the noise (in
+    dBm or `None`) from a Quality line, or `None` if it can't be parsed.
+    """
+    for re_name, quality_re in quality_re_dict.items():
+        match_result = quality_re.search(line)
+        if match_result is not None:
+            groups = match_result.groupdict()
+            quality = groups['quality']
+            signal = groups['siglevel']
+            noise = groups.get('noiselevel')
+            if re_name == 'relative':
+                actual, total = map(int, signal.split('/'))
+                signal = db2dbm(int((actual / total) * 100))
+            elif re_name == 'absolute':
+                quality = quality + '/100'
+                signal = db2dbm(int(signal))
+            else:
+                signal = int(signal)
+            return quality, signal, None if noise is None else int(noise)
+    return None
+
+
+try:
+    codecs.lookup_error('surrogateescape')
+    SSID_ERRORS = 'surrogateescape'
+except LookupError:  # Python 2.x
+    SSID_ERRORS = 'replace'
+
+escape_re = re.compile(br'\\x([0-9A-Fa-f]{2})')
+
+
+def unescape_ssid(raw):
+    """
+    Turns the ``\\xNN`` escapes that iwlist prints for bytes that aren't
+    printable ASCII back into those bytes.
+    """
+    return escape_re.sub(lambda match: binascii.unhexlify(match.group(1)), raw)
+
+
+def decode_ssid(ssid_bytes):
+    return ssid_bytes.decode('utf-8', SSID_ERRORS)
+
+
+def encode_ssid(ssid):
+    """
+    Returns the bytes that `ssid` was decoded from.
+    """
+    return ssid.encode('utf-8', SSID_ERRORS)
+
+
+def escape_ssid(ssid):
+    """
+    Returns `ssid` with the bytes that aren't UTF-8 escaped as ``\\xNN``,
+    so that it can be printed.
+    """
+    if ssid is None or SSID_ERRORS != 'surrogateescape':
+        return ssid
+    return encode_ssid(ssid).decode('utf-8', 'backslashreplace')
+
+
+def parse_ssid(value, encoding):
+    """
+    Returns the bytes and the decoded SSID of the raw value of an ESSID
+    line, from a block that was decoded with `encoding`.
+    """
+    ssid_bytes = unescape_ssid(normalize_value['ssid'](value).encode(encoding))
+    return ssid_bytes, decode_ssid(ssid_bytes)
+
+
+def decode_block(cell_block):
+    """
+    Returns the text of a cell block and the encoding it was decoded
+    with.  Blocks of bytes are decoded as Latin-1, which can't fail and
+    can be undone to get the bytes of the SSID back.
+    """
+    if isinstance(cell_block, bytes):
+        return cell_block.decode('latin-1'), 'latin-1'
+    return cell_block, 'utf-8'
+
+
+address_line_re = re.compile(r'^Address:[ \t]*(?P<value>\S*)')
+essid_line_re = re.compile(r'^\s*ESSID:(?P<value>.*)$', flags=re.MULTILINE)
+encryption_line_re = re.compile(r'^\s*Encryption key:(?P<value>.*)$', flags=re.MULTILINE)
+quality_line_re = re.compile(r'^\s*(?P<value>Quality.*)$', flags=re.MULTILINE)
+frequency_line_re = re.compile(r'^\s*Frequency:(?P<value>.*)$', flags=re.MULTILINE)
+channel_line_re = re.compile(r'^\s*Channel:(?P<value>.*)$', flags=re.MULTILINE)
+
+
+def raw_value(line_re, cell_block):
+    match = line_re.search(cell_block)
+    return match and match.group('value').strip()
+
+
+def raw_frequency(cell_block):
+    """
+    Returns the frequency (in MHz) and the channel of a raw block, worked
+    out as :func:`normalize` does.
+    """
+    mhz = channel = None
+    value = raw_value(frequency_line_re, cell_block)
+    matches = value and frequency_re.search(value)
+    if matches:
+        mhz = frequency_to_mhz(matches.group('frequency'))
+        if matches.group('channel'):
+            channel = int(matches.group('channel'))
+    if channel is None:
+        value = raw_value(channel_line_re, cell_block)
+        if value and value.isdigit():
+            channel = int(value)
+    if channel is None and mhz is not None:
+        channel = mhz_to_channel(mhz)
+    return mhz, channel
+
+
+def block_filter(ssid=None, bssid=None, encrypted=None, min_signal=None, channels=None, band=None):
+    """
+    Returns a function that tells whether the raw block of a cell (as
+    yielded by :func:`split_cells`) can match the given conditions, by
+    looking only at the lines that they depend on.  The cheapest checks
+    run first.  Returns `None` if there are no conditions.
+    """
+    checks = []
+    if bssid is not None:
+        bssid = bssid.upper()
+        checks.append(lambda block, encoding: (raw_value(address_line_re, block) or '').upper() == bssid)
+    if ssid is not None:
+        ssid_bytes = encode_ssid(ssid)
+
+        def check_ssid(block, encoding):
+            value = raw_value(essid_line_re, block)
+            return value is not None and parse_ssid(value, encoding)[0] == ssid_bytes
+        checks.append(check_ssid)
+    if encrypted is not None:
+        checks.append(lambda block, encoding: (raw_value(encryption_line_re, block) == 'on') == encrypted)
+    allowed = spectrum_filter(channels, band)
+    if allowed is not None:
+        checks.append(lambda block, encoding: allowed(*raw_frequency(block)))
+    if min_signal is not None:
+        def check_signal(block, encoding):
+            # As in normalize, the last Quality line that parses wins.
+            signal = None
+            for match in quality_line_re.finditer(block):
+                quality = parse_quality(match.group('value'))
+                if quality is not None:
+                    signal = quality[1]
+            return signal is not None and signal >= min_signal
+        checks.append(check_signal)
+
+    if not checks:
+        return None
+
+    def keep(block):
+        block, encoding = decode_block(block)
+        return all(check(block, encoding) for check in checks)
+    return keep
+
+
+# The SSIDs, addresses and so on of the networks in range, and their
+# bit rates, are the same from one scan to the next, so each cell shares
+# them instead of having copies of its own.
+interned = InternTable(4096)
+# Kept apart from the text, which compares equal to bytes on Python 2.
+interned_bytes = InternTable(1024)
+interned_bitrates = InternTable(256)
+
+
+def parse_bitrates(bitrates):
+    return bitrates, tuple(bitrate_to_mbps(bitrate) for bitrate in bitrates)
+
+
 def normalize(cell_block):
     # The cell blocks come in with every line except the first indented at
     # least 20 spaces.  This removes the first 20 spaces off of those lines.
+    cell_block, encoding = decode_block(cell_block)
     lines = textwrap.dedent(' ' * 20 + cell_block).splitlines()
     cell = Cell()
+    bitrates = []
 
     while lines:
         line = lines.pop(0)
 
         if line.startswith('Quality'):
-            for re_name, quality_re in quality_re_dict.items():
-                match_result = quality_re.search(line)
-                if match_result is not None:
-                    groups = match_result.groupdict()
-                    cell.quality = groups['quality']
-                    signal = groups['siglevel']
-                    noise = groups.get('noiselevel')
-                    if re_name == 'relative':
-                        actual, total = map(int, signal.split('/'))
-                        cell.signal = db2dbm(int((actual / total) * 100))
-                    elif re_name == 'absolute':
-                        cell.quality = cell.quality + '/100'
-                        cell.signal = db2dbm(int(signal))
-                    else:
-                        cell.signal = int(signal)
-                    if noise is not None:
-                        cell.noise = int(noise)
-                    break
+            quality = parse_quality(line)
+            if quality is not None:
+                cell.quality, cell.signal, noise = quality
+                if noise is not None:
+                    cell.noise = noise
 
         elif line.startswith('Bit Rates'):
             values = split_on_colon(line)[1].split('; ')
@@ -137,7 +562,7 @@ def normalize(cell_block):
                 while lines[0].startswith(' ' * 10):
                     values += lines.pop(0).strip().split('; ')
 
-            cell.bitrates.extend(values)
+            bitrates.extend(values)
         elif ':' in line:
             key, value = split_on_colon(line)
             key = normalize_key(key)
@@ -168,4 +593,20 @@ def normalize(cell_block):
     if cell.encrypted and not cell.encryption_type:
         cell.encryption_type = 'wep'
 
+    if cell.ssid is not None:
+        cell.ssid_bytes = interned_bytes(unescape_ssid(cell.ssid.encode(encoding)))
+        cell.ssid = interned(decode_ssid(cell.ssid_bytes))
+    for name in ('address', 'mode', 'frequency'):
+        value = getattr(cell, name)
+        if value is not None:
+            setattr(cell, name, interned(value))
+
+    if cell.frequency:
+        cell.frequency_mhz = frequency_to_mhz(cell.frequency)
+        if cell.channel is None:
+            cell.channel = mhz_to_channel(cell.frequency_mhz)
+    if cell.quality:
+        cell.quality_ratio = quality_to_ratio(cell.quality)
+    cell.bitrates, cell.bitrates_mbps = interned_bitrates(tuple(bitrates), parse_bitrates)
+
     return cell
@@ -1,9 +1,12 @@
 import re
+import os
 import itertools
 
 import wifi.subprocess_compat as subprocess
-from pbkdf2 import PBKDF2
-from wifi.utils import ensure_file_exists
+from wifi import metrics, runner
+from wifi.completion import read_index, write_index
+from wifi.locking import locked_file
+from wifi.utils import ensure_file_exists, monotonic
 from wifi.exceptions import ConnectionError
 
 
@@ -21,7 +24,10 @@ def configuration(cell, passkey=None):
     else:
         if cell.encryption_type.startswith('wpa'):
             if len(passkey) != 64:
-                passkey = PBKDF2(passkey, cell.ssid, 4096).hexread(32)
+                # pbkdf2 is only imported when needed, it's slow to import.
+                from pbkdf2 import PBKDF2
+                ssid = cell.ssid_bytes if cell.ssid_bytes is not None else cell.ssid.encode('utf-8')
+                passkey = PBKDF2(passkey, ssid, 4096).hexread(32)
 
             return {
                 'wpa-ssid': cell.ssid,
@@ -57,11 +63,24 @@ def configuration(cell, passkey=None):
 bound_ip_re = re.compile(r'^bound to (?P<ip_address>\S+)', flags=re.MULTILINE)
 
 
+def remaining(deadline):
+    """
+    Returns the number of seconds left until `deadline`, or `None` if
+    there is no deadline.
+    """
+    if deadline is None:
+        return None
+    return max(deadline - monotonic(), 0)
+
+
 class Scheme(object):
     """
     Saved configuration for connecting to a wireless network.  This
     class provides a Python interface to the /etc/network/interfaces
     file.
+
+    Reading the file takes a shared lock on it and changing it takes an
+    exclusive one, so that processes can share the file safely.
     """
 
     interfaces = '/etc/network/interfaces'
@@ -100,8 +119,12 @@ class Scheme(object):
         Returns an generator of saved schemes.
         """
         ensure_file_exists(cls.interfaces)
-        with open(cls.interfaces, 'r') as f:
-            return extract_schemes(f.read(), scheme_class=cls)
+        with locked_file(cls.interfaces) as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def parse(cls, content):
+        return extract_schemes(content, scheme_class=cls)
 
     @classmethod
     def where(cls, fn):
@@ -111,12 +134,16 @@ class Scheme(object):
     def find(cls, interface, name):
         """
         Returns a :class:`Scheme` or `None` based on interface and
-        name.
+        name.  Only the scheme's stanza is read when the index is up to
+        date.
         """
-        try:
-            return cls.where(lambda s: s.interface == interface and s.name == name)[0]
-        except IndexError:
-            return None
+        ensure_file_exists(cls.interfaces)
+        with locked_file(cls.interfaces, 'rb') as f:
+            for _, _, start, end in cls.lookup(f, interface, name)[1]:
+                f.seek(start)
+                for scheme in cls.parse(f.read(end - start).decode('utf-8')):
+                    return scheme
+        return None
 
     @classmethod
     def for_cell(cls, interface, name, cell, passkey=None):
@@ -124,35 +151,146 @@ class Scheme(object):
         Intuits the configuration needed for a specific
         :class:`Cell` and creates a :class:`Scheme` for it.
         """
+        # The interfaces file is UTF-8, so SSIDs that aren't can't be
+        # written to it.
+        try:
+            (cell.ssid or '').encode('utf-8')
+        except UnicodeEncodeError:
+            raise AssertionError("Can't save {0!r} to {1}, its SSID isn't UTF-8".format(cell, cls.interfaces))
         return cls(interface, name, configuration(cell, passkey))
 
     def save(self):
         """
         Writes the configuration to the :attr:`interfaces` file.
         """
-        assert not self.find(self.interface, self.name), "This scheme already exists"
+        ensure_file_exists(self.interfaces)
+        stanza = ('\n' + str(self)).encode('utf-8')
+
+        # The check and the write happen under the same lock, so two
+        # processes can't both save the same scheme.
+        with locked_file(self.interfaces, 'r+b', exclusive=True) as f:
+            entries, found = self.lookup(f, self.interface, self.name)
+            assert not found, "This scheme already exists"
 
-        with open(self.interfaces, 'a') as f:
-            f.write('\n')
-            f.write(str(self))
+            f.seek(0, os.SEEK_END)
+            start = f.tell() + 1
+            f.write(stanza)
+            f.flush()
+            self.store_index(entries + [(self.interface, self.name, start, start + len(stanza) - 1)])
 
     def delete(self):
         """
-        Deletes the configuration from the :attr:`interfaces` file.
-        """
-        iface = "iface %s-%s inet dhcp" % (self.interface, self.name)
-        content = ''
-        with open(self.interfaces, 'r') as f:
-            skip = False
-            for line in f:
-                if not line.strip():
-                    skip = False
-                elif line.strip() == iface:
-                    skip = True
-                if not skip:
-                    content += line
-        with open(self.interfaces, 'w') as f:
-            f.write(content)
+        Deletes the configuration from the :attr:`interfaces` file.  Only
+        the part of the file after the scheme's stanza is rewritten.
+        """
+        with locked_file(self.interfaces, 'r+b', exclusive=True) as f:
+            ranges = []
+            kept = []
+            removed = 0
+            for interface, name, start, end in self.lookup(f, self.interface, self.name)[0]:
+                if interface == self.interface and name == self.name:
+                    ranges.append((start, end))
+                    removed += end - start
+                else:
+                    kept.append((interface, name, start - removed, end - removed))
+
+            for start, end in reversed(ranges):
+                f.seek(end)
+                rest = f.read()
+                f.seek(start)
+                f.write(rest)
+                f.truncate()
+            f.flush()
+            self.store_index(kept)
+
+    @classmethod
+    def stanzas(cls, data):
+        """
+        Yields an ``(interface, name, start, end)`` tuple with the byte
+        range of each scheme's stanza in `data`.
+        """
+        offset = 0
+        stanza = None
+        for line in data.splitlines(True):
+            if stanza and line.startswith(b' '):
+                stanza[3] = offset + len(line)
+            else:
+                if stanza:
+                    yield tuple(stanza)
+                stanza = None
+                match = scheme_re.match(line.decode('utf-8'))
+                if match and all(match.groups()):
+                    stanza = list(match.groups()) + [offset, offset + len(line)]
+            offset += len(line)
+        if stanza:
+            yield tuple(stanza)
+
+    @classmethod
+    def lookup(cls, f, interface, name):
+        """
+        Returns the entries of the index of the locked :attr:`interfaces`
+        file `f`, and the ones of the scheme `interface`-`name`.
+
+        On filesystems with coarse timestamps, a hand edit that doesn't
+        change the size of the file can leave an index that looks up to
+        date.  So the scheme's ranges are checked against the file, and the
+        whole file is read if they are wrong or the scheme isn't in the
+        index.  The index isn't written here, so looking up missing schemes
+        doesn't write to the file's directory; :meth:`save` and
+        :meth:`delete` keep it up to date.
+        """
+        entries = read_index(cls.interfaces)
+        if entries is not None:
+            found = [entry for entry in entries if entry[:2] == (interface, name)]
+            if found and all(cls.is_stanza(f, entry) for entry in found):
+                return entries, found
+
+        f.seek(0)
+        entries = list(cls.stanzas(f.read()))
+        return entries, [entry for entry in entries if entry[:2] == (interface, name)]
+
+    @classmethod
+    def is_stanza(cls, f, entry):
+        """
+        Tells whether the range of the index `entry` in `f` is exactly the
+        stanza of its scheme.
+        """
+        interface, name, start, end = entry
+        f.seek(start)
+        # The line after the range shows whether the stanza goes on.
+        data = f.read(end - start) + f.readline()
+        try:
+            return next(iter(cls.stanzas(data)), None) == (interface, name, 0, end - start)
+        except UnicodeDecodeError:
+            return False
+
+    @classmethod
+    def store_index(cls, entries):
+        try:
+            write_index(cls.interfaces, entries)
+        except (IOError, OSError):
+            # The index is only a cache, it's rebuilt when it's needed.
+            pass
+
+    @classmethod
+    def refresh_index(cls):
+        """
+        Rebuilds the index of the stanzas in the :attr:`interfaces` file,
+        which is used for shell completion and by :meth:`find` and
+        :meth:`delete`, and returns its entries.
+        """
+        ensure_file_exists(cls.interfaces)
+        with locked_file(cls.interfaces, 'rb') as f:
+            entries = list(cls.stanzas(f.read()))
+            cls.store_index(entries)
+        return entries
+
+    @property
+    def ssid(self):
+        """
+        The SSID of the network this scheme connects to, if any.
+        """
+        return self.options.get('wpa-ssid', self.options.get('wireless-essid'))
 
     @property
     def iface(self):
@@ -164,16 +302,52 @@ class Scheme(object):
 
         return [self.interface + '=' + self.iface] + args
 
-    def activate(self):
+    def activate(self, timeout=None):
         """
         Connects to the network as configured in this scheme.
+
+        If `timeout` is given, the whole ifdown/ifup cycle has to finish
+        within that many seconds, otherwise :class:`ConnectionError` is
+        raised.
         """
+        start = monotonic()
+        deadline = None if timeout is None else start + timeout
 
-        subprocess.check_output(['/sbin/ifdown', self.interface], stderr=subprocess.STDOUT)
-        ifup_output = subprocess.check_output(['/sbin/ifup'] + self.as_args(), stderr=subprocess.STDOUT)
-        ifup_output = ifup_output.decode('utf-8')
+        try:
+            runner.run('ifdown', [self.interface], remaining(deadline))
+            ifdown_done = monotonic()
+            ifup_output = runner.run('ifup', self.as_args(), remaining(deadline))
+            connection = self.parse_ifup_output(ifup_output.decode('utf-8'))
+        except subprocess.TimeoutExpired:
+            metrics.activation_failures.inc()
+            metrics.activation_seconds.observe(monotonic() - start)
+            raise ConnectionError("Timed out connecting to %r" % self)
+        except (ConnectionError, subprocess.CalledProcessError):
+            metrics.activation_failures.inc()
+            metrics.activation_seconds.observe(monotonic() - start)
+            raise
+
+        end = monotonic()
+        metrics.activation_successes.inc()
+        metrics.activation_seconds.observe(end - start)
+        connection.timings = {
+            'ifdown': ifdown_done - start,
+            'ifup': end - ifdown_done,
+        }
+        return connection
 
-        return self.parse_ifup_output(ifup_output)
+    def roam(self, bssid, timeout=None):
+        """
+        Reconnects to the access point `bssid` of this scheme's network,
+        by activating a copy of the scheme that is pinned to it.
+        """
+        options = dict(self.options)
+        if 'wpa-ssid' in options:
+            options['wpa-bssid'] = bssid
+        else:
+            options['wireless-ap'] = bssid
+        # The scheme's own class, so that subclasses activate their own way.
+        return type(self)(self.interface, self.name, options).activate(timeout)
 
     def parse_ifup_output(self, output):
         matches = bound_ip_re.search(output)
@@ -186,10 +360,82 @@ class Scheme(object):
 class Connection(object):
     """
     The connection object returned when connecting to a Scheme.
+
+    :attr:`timings` maps the phases of the activation (``ifdown`` and
+    ``ifup``) to the number of seconds each of them took.
     """
-    def __init__(self, scheme, ip_address):
+    def __init__(self, scheme, ip_address, timings=None):
         self.scheme = scheme
         self.ip_address = ip_address
+        self.timings = timings or {}
+
+
+def rank_available(schemes, cells):
+    """
+    Pairs each scheme with the strongest of `cells` that has its SSID and
+    returns the pairs strongest signal first.  Schemes without a matching
+    cell are left out, and ties keep the order of `schemes`.
+    """
+    signal = lambda cell: cell.signal if cell.signal is not None else -100
+
+    strongest = {}
+    for cell in cells:
+        if cell.ssid not in strongest or signal(cell) > signal(strongest[cell.ssid]):
+            strongest[cell.ssid] = cell
+
+    pairs = [(scheme, strongest[scheme.ssid]) for scheme in schemes if scheme.ssid in strongest]
+    pairs.sort(key=lambda pair: signal(pair[1]), reverse=True)
+    return pairs
+
+
+class Attempt(object):
+    """
+    The outcome of a single activation made by :func:`activate_first`.
+    """
+    def __init__(self, scheme, duration, error=None, timings=None):
+        self.scheme = scheme
+        self.duration = duration
+        self.error = error
+        self.timings = timings or {}
+
+    def __repr__(self):
+        return 'Attempt(scheme={scheme!r}, duration={duration!r}, error={error!r})'.format(**vars(self))
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+def activate_first(schemes, timeout=None, attempt_timeout=None):
+    """
+    Activates each of `schemes` in turn until one of them connects.
+
+    `timeout` bounds the total time spent on all of the attempts and
+    `attempt_timeout` bounds each individual attempt.  Returns a tuple of
+    the first :class:`Connection` (or `None` if every attempt failed) and
+    the list of :class:`Attempt` objects that were made.
+    """
+    deadline = None if timeout is None else monotonic() + timeout
+    attempts = []
+
+    for scheme in schemes:
+        budget = attempt_timeout
+        if deadline is not None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            budget = remaining if budget is None else min(budget, remaining)
+
+        start = monotonic()
+        try:
+            connection = scheme.activate(timeout=budget)
+        except (ConnectionError, subprocess.CalledProcessError) as e:
+            attempts.append(Attempt(scheme, monotonic() - start, e))
+        else:
+            attempts.append(Attempt(scheme, monotonic() - start, timings=connection.timings))
+            return connection, attempts
+
+    return None, attempts
 
 
 scheme_re = re.compile(r'iface\s+(?P<interface>[^-]+)(?:-(?P<name>\S+))?')
@@ -0,0 +1,195 @@
+"""
+A compact binary format for archiving scans.
+
+A snapshot is a fixed header, one fixed size record per cell and a table
+of the SSIDs, which are stored once however many access points share
+them.  Snapshots can be appended one after the other to make an archive.
+All numbers are little-endian:
+
+======  ============================================================
+header  magic (``WSNP``), version (u16), timestamp (f64, seconds since
+        the epoch), interface (16 bytes, NUL padded), number of records
+        (u32), size of the SSID table (u32)
+record  BSSID (6 bytes), signal (i8, dBm), noise (i8, dBm), channel
+        (u16), frequency (u16, MHz), flags (u8), offset of the SSID in the
+        table (u32), length of the SSID (u8)
+======  ============================================================
+
+A missing channel or frequency is stored as 0.  :class:`Snapshot` reads
+the records straight out of the buffer it's given, and only makes
+:class:`~wifi.Cell` objects when asked to.
+"""
+import binascii
+import collections
+import struct
+import time
+
+from wifi.scan import Cell, decode_ssid, encode_ssid
+
+
+MAGIC = b'WSNP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHd16sII')
+RECORD = struct.Struct('<6sbbHHBIB')
+
+FLAG_ENCRYPTED = 0x01
+# Bits 1 and 2 hold the encryption type.
+ENCRYPTION_SHIFT = 1
+FLAG_AD_HOC = 0x08
+FLAG_SIGNAL = 0x10
+FLAG_NOISE = 0x20
+
+ENCRYPTION_TYPES = [None, 'wep', 'wpa', 'wpa2']
+
+Record = collections.namedtuple('Record', 'bssid signal noise channel frequency_mhz flags ssid')
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def encode_cell(cell, ssid_offset, ssid_length):
+    flags = 0
+    if cell.encrypted:
+        flags |= FLAG_ENCRYPTED
+    if cell.encryption_type in ENCRYPTION_TYPES:
+        flags |= ENCRYPTION_TYPES.index(cell.encryption_type) << ENCRYPTION_SHIFT
+    if cell.mode == 'Ad-Hoc':
+        flags |= FLAG_AD_HOC
+    if cell.signal is not None:
+        flags |= FLAG_SIGNAL
+    if cell.noise is not None:
+        flags |= FLAG_NOISE
+
+    bssid = binascii.unhexlify(cell.address.replace(':', '')) if cell.address else b'\0' * 6
+    return RECORD.pack(
+        bssid,
+        clamp(cell.signal or 0, -128, 127),
+        clamp(cell.noise or 0, -128, 127),
+        cell.channel or 0,
+        cell.frequency_mhz or 0,
+        flags,
+        ssid_offset,
+        ssid_length,
+    )
+
+
+def dumps(cells, interface, timestamp=None):
+    """
+    Returns a snapshot of `cells`, scanned on `interface` at `timestamp`
+    (defaults to now), as bytes.
+    """
+    records = []
+    strings = []
+    offsets = {}
+    size = 0
+    for cell in cells:
+        if cell.ssid_bytes is not None:
+            ssid = cell.ssid_bytes[:255]
+        else:
+            ssid = encode_ssid(cell.ssid or '')[:255]
+        if ssid not in offsets:
+            offsets[ssid] = size
+            strings.append(ssid)
+            size += len(ssid)
+        records.append(encode_cell(cell, offsets[ssid], len(ssid)))
+
+    header = HEADER.pack(MAGIC, VERSION, time.time() if timestamp is None else timestamp,
+                         interface.encode('utf-8')[:16], len(records), size)
+    return header + b''.join(records) + b''.join(strings)
+
+
+def dump(cells, f, interface, timestamp=None):
+    """
+    Writes a snapshot of `cells` to the binary file `f`.
+    """
+    f.write(dumps(cells, interface, timestamp))
+
+
+class Snapshot(object):
+    """
+    Reads the snapshot at `offset` in `data`, which can be anything that
+    supports the buffer protocol, without copying it.
+    """
+
+    def __init__(self, data, offset=0):
+        self.view = memoryview(data)
+        self.offset = offset
+
+        magic, version, self.timestamp, interface, self.count, strings_size = \
+            HEADER.unpack_from(self.view, offset)
+        if magic != MAGIC:
+            raise ValueError("Not a scan snapshot")
+        if version != VERSION:
+            raise ValueError("Unsupported snapshot version {0}".format(version))
+
+        self.version = version
+        self.interface = interface.rstrip(b'\0').decode('utf-8')
+        self.records_offset = offset + HEADER.size
+        self.strings_offset = self.records_offset + self.count * RECORD.size
+        #: The number of bytes the snapshot takes up.
+        self.size = self.strings_offset + strings_size - offset
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        """
+        Yields a :class:`Record` for each cell.  :attr:`Record.ssid` is
+        bytes, and missing values are `None`.
+        """
+        view = self.view
+        for i in range(self.count):
+            bssid, signal, noise, channel, mhz, flags, ssid_offset, ssid_length = \
+                RECORD.unpack_from(view, self.records_offset + i * RECORD.size)
+            start = self.strings_offset + ssid_offset
+            yield Record(
+                bssid,
+                signal if flags & FLAG_SIGNAL else None,
+                noise if flags & FLAG_NOISE else None,
+                channel or None,
+                mhz or None,
+                flags,
+                view[start:start + ssid_length].tobytes(),
+            )
+
+    def cells(self):
+        """
+        Yields a :class:`~wifi.Cell` for each record.
+        """
+        for record in self.records():
+            yield to_cell(record)
+
+
+def to_cell(record):
+    cell = Cell()
+    cell.ssid_bytes = record.ssid
+    cell.ssid = decode_ssid(record.ssid)
+    if record.bssid != b'\0' * 6:
+        cell.address = ':'.join('{0:02X}'.format(byte) for byte in bytearray(record.bssid))
+    cell.signal = record.signal
+    cell.noise = record.noise
+    cell.channel = record.channel
+    cell.frequency_mhz = record.frequency_mhz
+    if record.frequency_mhz:
+        cell.frequency = '{0:g} GHz'.format(record.frequency_mhz / 1000.0)
+    cell.encrypted = bool(record.flags & FLAG_ENCRYPTED)
+    cell.encryption_type = ENCRYPTION_TYPES[(record.flags >> ENCRYPTION_SHIFT) & 3]
+    cell.mode = 'Ad-Hoc' if record.flags & FLAG_AD_HOC else 'Master'
+    return cell
+
+
+def load_all(data):
+    """
+    Yields each :class:`Snapshot` in `data`, an archive of snapshots
+    written one after the other.
+    """
+    offset = 0
+    while offset < len(data):
+        snapshot = Snapshot(data, offset)
+        yield snapshot
+        offset += snapshot.size
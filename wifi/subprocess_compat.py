@@ -1,9 +1,19 @@
 """
-Python 2.6 doesn't provide subprocess.check_output or subprocess.check_call
+Python 2.6 doesn't provide subprocess.check_output or subprocess.check_call,
+and Python 2 doesn't have subprocess.TimeoutExpired or the `timeout`
+argument.
+
+Every external command wifi runs goes through :func:`check_output` here,
+which reports each invocation to the hooks registered with
+:func:`add_hook`.
 """
 
+import sys
+import threading
 from subprocess import *
 
+from wifi.utils import monotonic, print_table
+
 try:
     check_output
 except NameError:
@@ -61,3 +71,158 @@ except NameError:
                 cmd = popenargs[0]
             raise CalledProcessError(retcode, cmd)
         return 0
+
+
+try:
+    TimeoutExpired
+except NameError:
+    class TimeoutExpired(Exception):
+        """
+        Raised by :func:`check_output` when a command runs longer than its
+        `timeout`.
+        """
+        def __init__(self, cmd, timeout, output=None):
+            super(TimeoutExpired, self).__init__(cmd, timeout)
+            self.cmd = cmd
+            self.timeout = timeout
+            self.output = output
+
+        def __str__(self):
+            return "Command '%s' timed out after %s seconds" % (self.cmd, self.timeout)
+
+
+_check_output_without_timeout = check_output
+
+
+def watchdog_check_output(*popenargs, **kwargs):
+    """
+    Like check_output, but kills the command from a timer thread if it
+    runs longer than `timeout` seconds, for the Pythons whose
+    check_output has no `timeout`.
+    """
+    timeout = kwargs.pop('timeout', None)
+    if timeout is None:
+        return _check_output_without_timeout(*popenargs, **kwargs)
+    if 'stdout' in kwargs:
+        raise ValueError('stdout argument not allowed, it will be overridden.')
+
+    process = Popen(stdout=PIPE, *popenargs, **kwargs)
+    expired = []
+
+    def kill():
+        expired.append(True)
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        output, unused_err = process.communicate()
+    finally:
+        timer.cancel()
+
+    cmd = kwargs.get('args', popenargs[0] if popenargs else None)
+    if expired:
+        raise TimeoutExpired(cmd, timeout, output=output)
+    retcode = process.poll()
+    if retcode:
+        raise CalledProcessError(retcode, cmd, output=output)
+    return output
+
+
+if sys.version_info[0] < 3:
+    check_output = watchdog_check_output
+
+
+_check_output = check_output
+
+hooks = []
+
+
+def add_hook(hook):
+    """
+    Registers `hook` to be called after every command as ``hook(argv,
+    duration, output_bytes, returncode)``.  `returncode` is `None` when
+    the command couldn't be started or timed out.
+    """
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    hooks.remove(hook)
+
+
+def check_output(*popenargs, **kwargs):
+    if not hooks:
+        return _check_output(*popenargs, **kwargs)
+
+    argv = kwargs.get('args', popenargs[0] if popenargs else None)
+    start = monotonic()
+    try:
+        output = _check_output(*popenargs, **kwargs)
+    except CalledProcessError as e:
+        report(argv, monotonic() - start, len(e.output or b''), e.returncode)
+        raise
+    except (OSError, TimeoutExpired):
+        report(argv, monotonic() - start, 0, None)
+        raise
+    report(argv, monotonic() - start, len(output), 0)
+    return output
+
+
+def report(argv, duration, output_bytes, returncode):
+    """
+    Calls the hooks for a command that has finished.
+    """
+    for hook in list(hooks):
+        hook(argv, duration, output_bytes, returncode)
+
+
+class TraceCollector(object):
+    """
+    A hook that sums up the invocations of each program.  Use it as a
+    context manager to register it for the duration of a block::
+
+        with TraceCollector() as collector:
+            Cell.all('wlan0')
+        collector.print_summary()
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def __call__(self, argv, duration, output_bytes, returncode):
+        stats = self.stats.setdefault(argv[0], {
+            'calls': 0,
+            'failures': 0,
+            'seconds': 0.0,
+            'max_seconds': 0.0,
+            'bytes': 0,
+        })
+        stats['calls'] += 1
+        stats['failures'] += returncode != 0
+        stats['seconds'] += duration
+        stats['max_seconds'] = max(stats['max_seconds'], duration)
+        stats['bytes'] += output_bytes
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
+
+    def summary(self):
+        """
+        Returns ``(program, stats)`` pairs, most time spent first.
+        """
+        return sorted(self.stats.items(), key=lambda item: item[1]['seconds'], reverse=True)
+
+    def print_summary(self, file=None):
+        rows = [['program', 'calls', 'failures', 'seconds', 'max', 'bytes']]
+        for program, stats in self.summary():
+            rows.append([program, stats['calls'], stats['failures'],
+                         '%.3f' % stats['seconds'], '%.3f' % stats['max_seconds'], stats['bytes']])
+        print_table(rows, file=file or sys.stderr)
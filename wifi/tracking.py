@@ -0,0 +1,103 @@
+"""
+Smooths the signal of each access point over successive scans.
+
+A single reading of the signal is noisy, so decisions based on it flap.
+:class:`CellTracker` keeps an exponentially weighted moving average and
+variance of the signal of every BSSID it has seen, in constant memory per
+BSSID, and forgets access points that haven't been seen for a while.
+"""
+from wifi.utils import monotonic
+
+
+class SignalStats(object):
+    """
+    The smoothed signal of one access point.  :attr:`cell` is the latest
+    :class:`~wifi.Cell` seen for it.
+    """
+    __slots__ = ('cell', 'mean', 'variance', 'min', 'max', 'count', 'first_seen', 'last_seen')
+
+    def __init__(self, cell, now):
+        self.cell = cell
+        self.mean = float(cell.signal)
+        self.variance = 0.0
+        self.min = self.max = cell.signal
+        self.count = 1
+        self.first_seen = self.last_seen = now
+
+    def __repr__(self):
+        return 'SignalStats(address={0!r}, mean={1:.1f}, variance={2:.1f})'.format(
+            self.cell.address, self.mean, self.variance)
+
+    def add(self, cell, now, alpha):
+        diff = cell.signal - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.min = min(self.min, cell.signal)
+        self.max = max(self.max, cell.signal)
+        self.count += 1
+        self.cell = cell
+        self.last_seen = now
+
+
+class CellTracker(object):
+    """
+    Feed it every scan with :meth:`update`.  `alpha` is the weight of the
+    newest reading.  BSSIDs that haven't been seen for `max_age` seconds
+    are forgotten, and no more than `max_bssids` are kept.
+    """
+
+    def __init__(self, alpha=0.3, max_age=300, max_bssids=1024, clock=monotonic):
+        self.alpha = alpha
+        self.max_age = max_age
+        self.max_bssids = max_bssids
+        self.clock = clock
+        self.stats = {}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def __iter__(self):
+        return iter(self.stats.values())
+
+    def get(self, bssid):
+        return self.stats.get(bssid)
+
+    def update(self, cells):
+        now = self.clock()
+        for cell in cells:
+            if cell.address is None or cell.signal is None:
+                continue
+            stats = self.stats.get(cell.address)
+            if stats is None:
+                self.stats[cell.address] = SignalStats(cell, now)
+            else:
+                stats.add(cell, now, self.alpha)
+        self.evict(now)
+
+    def evict(self, now=None):
+        now = self.clock() if now is None else now
+        for bssid, stats in list(self.stats.items()):
+            if now - stats.last_seen > self.max_age:
+                del self.stats[bssid]
+
+        if len(self.stats) > self.max_bssids:
+            oldest = sorted(self.stats.values(), key=lambda stats: stats.last_seen)
+            for stats in oldest[:len(self.stats) - self.max_bssids]:
+                del self.stats[stats.cell.address]
+
+    def signal(self, cell):
+        """
+        Returns the smoothed signal of `cell`, or its raw signal if it
+        isn't being tracked.
+        """
+        stats = self.stats.get(cell.address)
+        return stats.mean if stats else cell.signal
+
+    def ranked(self, ssid=None):
+        """
+        Returns the tracked access points (of `ssid`, if given), strongest
+        smoothed signal first.
+        """
+        stats = [s for s in self.stats.values() if ssid is None or s.cell.ssid == ssid]
+        return sorted(stats, key=lambda s: s.mean, reverse=True)
@@ -1,13 +1,53 @@
 from __future__ import print_function, unicode_literals, division
 
+import collections
 import os
 import sys
+import threading
+import time
 
 
 if sys.version < '3':
     str = unicode
 
 
+# time.monotonic is Python 3.3+, older versions have to make do with the
+# wall clock.
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class InternTable(object):
+    """
+    Hands out a single shared copy of equal values, so that the values
+    that come up in every scan aren't kept in memory once per scan.  At
+    most `maxsize` values are remembered; the least recently used ones are
+    forgotten first.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.values = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __call__(self, key, make=None):
+        """
+        Returns the shared copy of `key`, or of ``make(key)`` if `make` is
+        given.
+        """
+        with self.lock:
+            try:
+                value = self.values.pop(key)
+            except KeyError:
+                value = key if make is None else make(key)
+                if len(self.values) >= self.maxsize:
+                    self.values.popitem(last=False)
+            self.values[key] = value
+            return value
+
+
 def match(needle, haystack):
     """
     Command-T-style string matching.
@@ -37,7 +77,7 @@ def print_table(matrix, sep='  ', file=sys.stdout, *args, **kwargs):
     format = sep.join('{{{0}:<{1}}}'.format(i, length) for i, length in enumerate(lengths))
 
     for row in matrix:
-        print(format.format(*row).strip(), file=file, *args, **kwargs)
+        print(format.format(*map(str, row)).strip(), file=file, *args, **kwargs)
 
 
 def db2dbm(quality):
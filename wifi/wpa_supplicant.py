@@ -0,0 +1,481 @@
+"""
+Talks to wpa_supplicant over its control interface.
+
+When wpa_supplicant owns the radio, running iwlist next to it fails with
+"Device or resource busy" and scans twice.  Asking wpa_supplicant for its
+scan results instead avoids both.
+
+:class:`NetworkScheme` keeps schemes as network blocks in
+wpa_supplicant.conf and switches between them without taking the
+interface down.
+"""
+import binascii
+import collections
+import itertools
+import os
+import re
+import socket
+import tempfile
+import time
+
+from wifi import metrics
+from wifi.scan import Cell, band_range, channel_to_mhz, decode_ssid, mhz_to_channel, spectrum_filter
+from wifi.scheme import Connection, Scheme, configuration, remaining
+from wifi.exceptions import ConnectionError, InterfaceError
+from wifi.utils import monotonic
+
+
+DEFAULT_CTRL_DIR = '/var/run/wpa_supplicant'
+
+# The fields of BSS replies that cells are made from: id, bssid, freq,
+# level, flags and ssid.
+BSS_MASK = 0x1887
+
+_counter = itertools.count()
+
+
+class Control(object):
+    """
+    A connection to the control socket of one interface, at `path`.
+
+    The control interface is a Unix datagram socket, so the client needs a
+    socket of its own for the replies to be sent to.
+    """
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self.events = collections.deque()
+        self.local = os.path.join(tempfile.gettempdir(), 'wifi_ctrl_{0}-{1}'.format(
+            os.getpid(), next(_counter)))
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.socket.bind(self.local)
+            self.socket.connect(path)
+        except socket.error as e:
+            self.close()
+            raise InterfaceError("Couldn't connect to wpa_supplicant at {0}: {1}".format(path, e))
+
+    def close(self):
+        self.socket.close()
+        if os.path.exists(self.local):
+            os.remove(self.local)
+
+    def receive(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            raise InterfaceError("Timed out waiting for wpa_supplicant")
+        self.socket.settimeout(timeout)
+        try:
+            return self.socket.recv(65536).decode('utf-8', 'replace')
+        except socket.timeout:
+            raise InterfaceError("Timed out waiting for wpa_supplicant")
+
+    def request(self, command):
+        """
+        Sends `command` and returns the reply.  Events that arrive in the
+        meantime are kept for :meth:`wait_event`.
+        """
+        self.socket.send(command.encode('utf-8'))
+        while True:
+            message = self.receive()
+            # Unsolicited events start with their priority, like <3>.
+            if message.startswith('<'):
+                self.events.append(message.split('>', 1)[1])
+            else:
+                return message.rstrip('\n')
+
+    def wait_event(self, name, timeout=None):
+        """
+        Waits for an event starting with `name` (like
+        ``CTRL-EVENT-SCAN-RESULTS``, or a tuple of names) and returns it.
+        The control socket has to be attached.
+        """
+        deadline = monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            while self.events:
+                event = self.events.popleft()
+                if event.startswith(name):
+                    return event
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise InterfaceError("Timed out waiting for {0} from wpa_supplicant".format(name))
+            message = self.receive(remaining)
+            if message.startswith('<'):
+                self.events.append(message.split('>', 1)[1])
+
+
+printf_escape_re = re.compile(br'\\(x[0-9A-Fa-f]{2}|.)')
+printf_escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'e': b'\x1b'}
+bss_id_re = re.compile(r'^id=(\d+)$', re.MULTILINE)
+
+
+def printf_decode(escaped):
+    """
+    Undoes the escaping wpa_supplicant does to SSIDs: ``\\xNN`` for bytes
+    that aren't printable, and C escapes for a few others.
+    """
+    def replace(match):
+        code = match.group(1)
+        if len(code) == 3:
+            return binascii.unhexlify(code[1:])
+        return printf_escapes.get(code, code)
+    return printf_escape_re.sub(replace, escaped)
+
+
+def flags_to_encryption(flags):
+    if 'WPA2' in flags or 'RSN' in flags:
+        return 'wpa2'
+    elif 'WPA' in flags:
+        return 'wpa'
+    elif 'WEP' in flags:
+        return 'wep'
+    return None
+
+
+def parse_bss(reply):
+    """
+    Turns the reply to a ``BSS`` request into a :class:`Cell`, or `None`
+    if there is no such BSS.
+    """
+    fields = dict(line.split('=', 1) for line in reply.splitlines() if '=' in line)
+    if 'bssid' not in fields:
+        return None
+    return make_cell(fields['bssid'], fields.get('freq', '0'), fields.get('level', '0'),
+                     fields.get('flags', ''), fields.get('ssid', ''))
+
+
+def make_cell(bssid, frequency, signal, flags, ssid):
+    cell = Cell()
+    cell.address = bssid.upper()
+    cell.ssid_bytes = printf_decode(ssid.encode('utf-8'))
+    cell.ssid = decode_ssid(cell.ssid_bytes)
+    cell.frequency_mhz = int(frequency)
+    cell.frequency = '{0:g} GHz'.format(cell.frequency_mhz / 1000.0)
+    cell.channel = mhz_to_channel(cell.frequency_mhz)
+    cell.signal = int(signal)
+    cell.encryption_type = flags_to_encryption(flags)
+    cell.encrypted = cell.encryption_type is not None
+    cell.mode = 'Ad-Hoc' if '[IBSS]' in flags else 'Master'
+    return cell
+
+
+def scan_results(control):
+    """
+    Returns a cell for each BSS that wpa_supplicant knows about.
+
+    Control replies are built in a 4 KB buffer and cut short without
+    warning when it fills, so ``SCAN_RESULTS`` loses networks on busy
+    sites.  The BSS table is read one entry per request instead.
+    """
+    cells = []
+    command = 'BSS FIRST MASK=0x{0:x}'.format(BSS_MASK)
+    while True:
+        reply = control.request(command)
+        cell = parse_bss(reply)
+        if cell is None:
+            return cells
+        cells.append(cell)
+        match = bss_id_re.search(reply)
+        if match is None:
+            return cells
+        command = 'BSS NEXT-{0} MASK=0x{1:x}'.format(match.group(1), BSS_MASK)
+
+
+def scan_frequencies(channels=None, band=None):
+    """
+    Returns the ``freq`` parameter of ``SCAN`` that limits the scan to
+    `channels` and `band`, or `None` to scan every channel.
+    """
+    if channels is not None:
+        allowed = spectrum_filter(band=band) or (lambda mhz, channel: True)
+        frequencies = sorted(set(channel_to_mhz(channel) for channel in channels))
+        return ','.join(str(mhz) for mhz in frequencies if mhz is not None and allowed(mhz, None))
+    if band is not None:
+        return '{0}-{1}'.format(*band_range(band))
+    return None
+
+
+def scan(interface, ctrl_dir=DEFAULT_CTRL_DIR, fresh=True, timeout=10, channels=None, band=None):
+    """
+    Returns the cells that wpa_supplicant has found on `interface`.  With
+    `fresh`, it asks for a new scan and waits for it to finish first;
+    otherwise the results of its last scan are returned right away.
+
+    With `channels` or `band`, only those frequencies are scanned, and
+    only the cells on them are returned.
+    """
+    allowed = spectrum_filter(channels, band)
+    frequencies = scan_frequencies(channels, band)
+    if frequencies == '':
+        return []
+
+    control = Control(os.path.join(ctrl_dir, interface), timeout)
+    try:
+        if fresh:
+            if control.request('ATTACH') != 'OK':
+                raise InterfaceError("wpa_supplicant refused to send events")
+            reply = control.request('SCAN' if frequencies is None else 'SCAN freq=' + frequencies)
+            # FAIL-BUSY means that a scan is already running, so its results
+            # are just as good.
+            if reply not in ('OK', 'FAIL-BUSY'):
+                raise InterfaceError("wpa_supplicant couldn't scan: {0}".format(reply))
+            control.wait_event('CTRL-EVENT-SCAN-RESULTS')
+            control.request('DETACH')
+
+        cells = scan_results(control)
+    finally:
+        control.close()
+
+    # The results include the networks found on other channels by earlier
+    # scans.
+    if allowed is None:
+        return cells
+    return [cell for cell in cells if allowed(cell.frequency_mhz, cell.channel)]
+
+
+def quote(value):
+    """
+    Returns `value`, text or bytes, as a wpa_supplicant.conf string: in
+    double quotes, or hex encoded if it can't be quoted.
+    """
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    if b'"' in value or any(byte < 32 or byte > 126 for byte in bytearray(value)):
+        return binascii.hexlify(value).decode('ascii')
+    return '"{0}"'.format(value.decode('ascii'))
+
+
+def unquote(value):
+    if value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    try:
+        return decode_ssid(binascii.unhexlify(value))
+    except (TypeError, ValueError):
+        return value
+
+
+def network_configuration(cell, passkey=None):
+    """
+    Returns a dictionary of the network block options for connecting to
+    `cell`.
+    """
+    options = configuration(cell, passkey)
+    network = {'ssid': quote(cell.ssid_bytes if cell.ssid_bytes is not None else cell.ssid)}
+    if 'wpa-psk' in options:
+        network['key_mgmt'] = 'WPA-PSK'
+        network['psk'] = options['wpa-psk']
+    elif 'wireless-key' in options:
+        key = options['wireless-key']
+        network['key_mgmt'] = 'NONE'
+        network['wep_key0'] = quote(key[2:]) if key.startswith('s:') else key
+        network['wep_tx_keyidx'] = '0'
+    else:
+        network['key_mgmt'] = 'NONE'
+    return network
+
+
+class NetworkScheme(Scheme):
+    """
+    A :class:`~wifi.Scheme` that is saved as a network block in
+    wpa_supplicant.conf and activated through the control interface, by
+    selecting the network, instead of with ifdown and ifup.  The interface
+    stays up, so the DHCP client that is already running on it picks up
+    the new network.
+
+    The scheme's interface and name are kept in the ``id_str`` of the
+    block, and the options are the other lines of the block, with their
+    values as they are written in the file.
+    """
+
+    # Named like Scheme's so that for_file and the completion index work
+    # the same way; it's the path of wpa_supplicant.conf.
+    interfaces = '/etc/wpa_supplicant/wpa_supplicant.conf'
+    ctrl_dir = DEFAULT_CTRL_DIR
+
+    #: The timeout of :meth:`activate` when none is given.
+    activation_timeout = 30
+    poll_interval = 0.1
+
+    def __str__(self):
+        """
+        Returns the network block for wpa_supplicant.conf.
+        """
+        lines = ['    id_str="{0}"'.format(self.iface)]
+        lines.extend('    {k}={v}'.format(k=k, v=v) for k, v in self.options.items())
+        return 'network={\n' + '\n'.join(lines) + '\n}\n'
+
+    @classmethod
+    def parse(cls, content):
+        """
+        Network blocks without an ``id_str`` of the form
+        ``interface-name`` are left out.
+        """
+        return extract_networks(content, scheme_class=cls)
+
+    @classmethod
+    def for_cell(cls, interface, name, cell, passkey=None):
+        return cls(interface, name, network_configuration(cell, passkey))
+
+    @classmethod
+    def stanzas(cls, data):
+        offset = 0
+        start = None
+        for line in data.splitlines(True):
+            stripped = line.strip()
+            if start is None and stripped == b'network={':
+                start = offset
+                id_str = ''
+            elif start is not None and stripped.startswith(b'id_str='):
+                id_str = unquote(stripped[len(b'id_str='):].decode('utf-8'))
+            elif start is not None and stripped == b'}':
+                if '-' in id_str:
+                    interface, name = id_str.split('-', 1)
+                    yield (interface, name, start, offset + len(line))
+                start = None
+            offset += len(line)
+
+    @property
+    def ssid(self):
+        if 'ssid' not in self.options:
+            return None
+        return unquote(self.options['ssid'])
+
+    def network_id(self, control):
+        """
+        Returns wpa_supplicant's id of this scheme's network, or `None` if
+        it doesn't know it.
+        """
+        for line in control.request('LIST_NETWORKS').splitlines()[1:]:
+            network_id = line.split('\t', 1)[0]
+            if control.request('GET_NETWORK {0} id_str'.format(network_id)) == '"{0}"'.format(self.iface):
+                return network_id
+        return None
+
+    def activate(self, timeout=None):
+        """
+        Connects to the network by selecting it in wpa_supplicant, which
+        re-reads its configuration first if it doesn't know the network
+        yet.  Waits for the association and for the DHCP client to get an
+        address, for no longer than `timeout` seconds altogether.
+        """
+        return self.connect(self.select, timeout)
+
+    def roam(self, bssid, timeout=None):
+        """
+        Pins the network to the access point `bssid` and moves to it
+        without disconnecting, or reassociates if wpa_supplicant can't roam
+        there.  Fails unless wpa_supplicant ends up on `bssid`.
+        """
+        return self.connect(lambda control, deadline: self.reassociate(control, bssid, deadline), timeout)
+
+    def connect(self, steps, timeout):
+        """
+        Runs ``steps(control, deadline)``, which returns the time of
+        association and the IP address, and records it in the metrics.
+        """
+        start = monotonic()
+        deadline = start + (self.activation_timeout if timeout is None else timeout)
+
+        try:
+            control = Control(os.path.join(self.ctrl_dir, self.interface), remaining(deadline))
+            try:
+                associated, ip_address = steps(control, deadline)
+            finally:
+                control.close()
+        except (ConnectionError, InterfaceError) as e:
+            metrics.activation_failures.inc()
+            metrics.activation_seconds.observe(monotonic() - start)
+            if isinstance(e, InterfaceError):
+                raise ConnectionError("Failed to connect to %r: %s" % (self, e))
+            raise
+
+        end = monotonic()
+        metrics.activation_successes.inc()
+        metrics.activation_seconds.observe(end - start)
+        return Connection(self, ip_address, timings={
+            'associate': associated - start,
+            'dhcp': end - associated,
+        })
+
+    def status(self, control):
+        return dict(line.split('=', 1) for line in control.request('STATUS').splitlines() if '=' in line)
+
+    def known_network_id(self, control):
+        network_id = self.network_id(control)
+        if network_id is None:
+            control.request('RECONFIGURE')
+            network_id = self.network_id(control)
+        if network_id is None:
+            raise ConnectionError("wpa_supplicant doesn't know %r" % self)
+        return network_id
+
+    def select(self, control, deadline):
+        network_id = self.known_network_id(control)
+
+        control.request('ATTACH')
+        if control.request('SELECT_NETWORK {0}'.format(network_id)) != 'OK':
+            raise ConnectionError("wpa_supplicant couldn't select %r" % self)
+
+        # Selecting the network that is already up does nothing, so there is
+        # no event to wait for.
+        status = self.status(control)
+        if status.get('wpa_state') != 'COMPLETED' or status.get('id_str') != self.iface:
+            self.wait_connected(control, deadline)
+        associated = monotonic()
+        return associated, self.wait_address(control, deadline)
+
+    def reassociate(self, control, bssid, deadline):
+        network_id = self.known_network_id(control)
+        if control.request('BSSID {0} {1}'.format(network_id, bssid.lower())) != 'OK':
+            raise ConnectionError("wpa_supplicant couldn't pin %r to %s" % (self, bssid))
+
+        control.request('ATTACH')
+        if (control.request('ROAM {0}'.format(bssid.lower())) != 'OK'
+                and control.request('REASSOCIATE') != 'OK'):
+            raise ConnectionError("wpa_supplicant couldn't move %r to %s" % (self, bssid))
+        self.wait_connected(control, deadline)
+        associated = monotonic()
+
+        if self.status(control).get('bssid', '').lower() != bssid.lower():
+            raise ConnectionError("Failed to move %r to %s" % (self, bssid))
+        return associated, self.wait_address(control, deadline)
+
+    def wait_connected(self, control, deadline):
+        event = control.wait_event(('CTRL-EVENT-CONNECTED', 'CTRL-EVENT-SSID-TEMP-DISABLED'),
+                                   remaining(deadline))
+        if not event.startswith('CTRL-EVENT-CONNECTED'):
+            raise ConnectionError("Failed to connect to %r: %s" % (self, event))
+
+    def wait_address(self, control, deadline):
+        while True:
+            status = self.status(control)
+            if status.get('ip_address'):
+                return status['ip_address']
+            if not remaining(deadline):
+                raise ConnectionError("Timed out waiting for an address for %r" % self)
+            time.sleep(min(self.poll_interval, remaining(deadline)))
+
+
+def extract_networks(config, scheme_class=NetworkScheme):
+    lines = iter(config.splitlines())
+    for line in lines:
+        if line.strip() != 'network={':
+            continue
+
+        options = {}
+        for line in lines:
+            line = line.strip()
+            if line == '}':
+                break
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                options[key] = value
+
+        id_str = unquote(options.pop('id_str', ''))
+        if '-' not in id_str:
+            continue
+        interface, name = id_str.split('-', 1)
+
+        yield scheme_class(interface, name, options)